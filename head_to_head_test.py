@@ -1,27 +1,16 @@
 from __future__ import division
 import tourney
+import tourney_sim
+from tourney_sim import PlayerWithAbility
 import random
 import argparse
+import numpy
+import scipy.special
 
 DEFAULT_NUM_PLAYERS = 6
 DEFAULT_NUM_TRIALS = 100000
-
-class PlayerWithAbility(object):
-    def __init__(self, name, ability):
-        self._name = name
-        self._ability = ability
-    
-    def __init__(self, name):
-        self._name = name
-        self._ability = random.gauss(0, 1)
-    
-    @property
-    def name(self):
-        return self._name
-    
-    @property
-    def ability(self):
-        return self._ability
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_CONFIDENCE = 0.95
 
 def simulate_round(pairs):
     results = [list(pair) for pair in pairs]
@@ -31,13 +20,18 @@ def simulate_round(pairs):
             r.reverse()
     return results
 
-def main(num_players, num_trials):
+"""Plays num_trials round-robin tournaments one at a time.
+
+Returns the number of trials in which exactly two players tied for first
+and the better of them won their game, the number in which the worse of
+them won their game, and the number of other trials.
+"""
+def simulate_trials(num_players, num_trials):
     NUM_PLAYERS = num_players
     NUM_TRIALS = num_trials
     num_head_to_head_successes = 0
     num_head_to_head_failures = 0
     num_not_head_to_head_tie = 0
-    assert(NUM_PLAYERS % 2 == 0)
     PLAYER_NAMES_LIST = ['Andrea', 'Barry', 'Chantal', 'Dorian', 'Erin',
         'Fernand', 'Gabrielle', 'Humberto', 'Ingrid', 'Jerry', 'Karen',
         'Lorenzo', 'Melissa', 'Nestor', 'Olga', 'Pablo', 'Rebekah',
@@ -48,7 +42,8 @@ def main(num_players, num_trials):
         t = tourney.RoundRobinPairedTournament(players)
         NUM_ROUNDS = NUM_PLAYERS - 1
         for r in range(1, NUM_ROUNDS + 1):
-            results = simulate_round(t.next_pairing())
+            results = simulate_round([(players[x], players[y])
+                for x, y in t.next_pairing_indices().tolist()])
             t.push_results(results)
         st = t.score_table
         high_score = max(st.values())
@@ -64,8 +59,124 @@ def main(num_players, num_trials):
             num_head_to_head_failures += 1
         else:
             print("This isn't supposed to happen!")
+    return (num_head_to_head_successes, num_head_to_head_failures,
+        num_not_head_to_head_tie)
+
+"""Plays num_trials round-robin tournaments as arrays, batch_size
+tournaments at a time, and returns the same counts as simulate_trials.
+
+The abilities of a batch are a trials x players array and the outcomes a
+trials x rounds x games array, with the games of each round given by the
+round-robin schedule.  Both are drawn from rng if one is given, or else
+from numpy.random.
+"""
+def simulate_trials_batch(num_players, num_trials,
+    batch_size=DEFAULT_BATCH_SIZE, rng=None):
+    if rng is None:
+        rng = numpy.random
+    schedule = tourney.round_robin_schedule(num_players)
+    first = schedule[..., 0]
+    second = schedule[..., 1]
+    num_head_to_head_successes = 0
+    num_head_to_head_failures = 0
+    num_not_head_to_head_tie = 0
+    for batch_start in range(0, num_trials, batch_size):
+        trials = min(batch_size, num_trials - batch_start)
+        trial_indices = numpy.arange(trials)
+        abilities = rng.normal(size=(trials, num_players))
+        noise = rng.normal(size=(trials,) + first.shape)
+        first_wins = abilities[:, first] + noise >= abilities[:, second]
+        winners = numpy.where(first_wins, first, second)
+        losers = numpy.where(first_wins, second, first)
+        scores = numpy.bincount((winners.reshape(trials, -1) +
+            num_players * trial_indices[:, numpy.newaxis]).ravel(),
+            minlength=trials * num_players).reshape(trials, num_players)
+        tied = scores == scores.max(axis=1)[:, numpy.newaxis]
+        two_tied = tied.sum(axis=1) == 2
+        num_not_head_to_head_tie += trials - int(two_tied.sum())
+        tied = tied[two_tied]
+        better = numpy.where(tied, abilities[two_tied], -numpy.inf).argmax(
+            axis=1)
+        worse = numpy.where(tied, abilities[two_tied], numpy.inf).argmin(
+            axis=1)
+        wins = numpy.zeros((trials, num_players, num_players), dtype=bool)
+        wins[trial_indices[:, numpy.newaxis, numpy.newaxis], winners,
+            losers] = True
+        successes = int(wins[trial_indices[two_tied], better, worse].sum())
+        num_head_to_head_successes += successes
+        num_head_to_head_failures += int(two_tied.sum()) - successes
+    return (num_head_to_head_successes, num_head_to_head_failures,
+        num_not_head_to_head_tie)
+
+"""Plays batches of batch_size trials as in simulate_trials_batch, up to
+max_trials, stopping early once the confidence interval (at the given
+confidence) for the success percentage is at most width percentage points
+wide, or once the z-score of the successes against failures is at least
+z_threshold in absolute value, if either is given.  Returns the counts of
+simulate_trials followed by the number of trials played.
+
+The criteria are checked after every batch, so a z_threshold meant to make
+a false finding unlikely must be larger than for a single test.
+"""
+def simulate_trials_sequential(num_players, max_trials, width=None,
+    z_threshold=None, confidence=DEFAULT_CONFIDENCE,
+    batch_size=DEFAULT_BATCH_SIZE, rng=None):
+    z_confidence = scipy.special.ndtri(0.5 + confidence / 2)
+    num_head_to_head_successes = 0
+    num_head_to_head_failures = 0
+    num_not_head_to_head_tie = 0
+    trials = 0
+    while trials < max_trials:
+        batch = min(batch_size, max_trials - trials)
+        successes, failures, not_tie = simulate_trials_batch(num_players,
+            batch, batch, rng)
+        num_head_to_head_successes += successes
+        num_head_to_head_failures += failures
+        num_not_head_to_head_tie += not_tie
+        trials += batch
+        ties = num_head_to_head_successes + num_head_to_head_failures
+        if ties == 0:
+            continue
+        p = num_head_to_head_successes / ties
+        if (width is not None and
+            2 * z_confidence * (p * (1 - p) / ties)**0.5 * 100 <= width):
+            break
+        if (z_threshold is not None and abs(num_head_to_head_successes -
+            num_head_to_head_failures) / ties**0.5 >= z_threshold):
+            break
+    return (num_head_to_head_successes, num_head_to_head_failures,
+        num_not_head_to_head_tie, trials)
+
+"""Runs num_trials trials and prints the results.  If width or z_threshold
+is given, the trials may stop early, as in simulate_trials_sequential."""
+def main(num_players, num_trials, batch_size=DEFAULT_BATCH_SIZE,
+    seed=None, width=None, z_threshold=None, confidence=DEFAULT_CONFIDENCE):
+    NUM_PLAYERS = num_players
+    NUM_TRIALS = num_trials
+    assert(NUM_PLAYERS % 2 == 0)
+    if width is not None or z_threshold is not None:
+        if batch_size <= 0:
+            raise ValueError("Stopping early requires a batch size")
+        rng = tourney_sim.spawn_rngs(seed, 1)[0]
+        (num_head_to_head_successes, num_head_to_head_failures,
+            num_not_head_to_head_tie, NUM_TRIALS) = (
+            simulate_trials_sequential(NUM_PLAYERS, num_trials, width,
+            z_threshold, confidence, batch_size, rng))
+    elif batch_size > 0:
+        rng = tourney_sim.spawn_rngs(seed, 1)[0]
+        (num_head_to_head_successes, num_head_to_head_failures,
+            num_not_head_to_head_tie) = simulate_trials_batch(NUM_PLAYERS,
+            NUM_TRIALS, batch_size, rng)
+    else:
+        random.seed(seed)
+        (num_head_to_head_successes, num_head_to_head_failures,
+            num_not_head_to_head_tie) = simulate_trials(NUM_PLAYERS,
+            NUM_TRIALS)
     print("Number of players         : {0:7d}".format(NUM_PLAYERS))
     print("Total trials              : {0:7d}".format(NUM_TRIALS))
+    if NUM_TRIALS < num_trials:
+        print("Trials saved              : {0:7d}".format(num_trials -
+            NUM_TRIALS))
     print("Trials with 2 tied leaders: {0:7d}".format(
         num_head_to_head_successes + num_head_to_head_failures))
     print("Head-to-head successes    : {0:7d}".format(
@@ -88,5 +199,22 @@ if __name__ == "__main__":
         default=DEFAULT_NUM_PLAYERS, help='the number of players, up to 20')
     parser.add_argument('--trials', type=int, dest='num_teams', # nargs='?',
         default=DEFAULT_NUM_TRIALS, help='the number of trials')
+    parser.add_argument('--batch-size', type=int, dest='batch_size',
+        default=DEFAULT_BATCH_SIZE,
+        help='the number of trials simulated at once as arrays, or 0 to '
+        'simulate the trials one at a time')
+    parser.add_argument('--seed', type=int, dest='seed', default=None,
+        help='the seed of the random number generator, for reproducible '
+        'results')
+    parser.add_argument('--width', type=float, dest='width', default=None,
+        help='stop once the confidence interval for the success percentage '
+        'is at most this many points wide')
+    parser.add_argument('--confidence', type=float, dest='confidence',
+        default=DEFAULT_CONFIDENCE,
+        help='the confidence level of the interval for --width')
+    parser.add_argument('--z-threshold', type=float, dest='z_threshold',
+        default=None, help='stop once the absolute z-score is at least '
+        'this')
     args = parser.parse_args()
-    main(args.num_players, args.num_teams)
+    main(args.num_players, args.num_teams, args.batch_size, args.seed,
+        args.width, args.z_threshold, args.confidence)
@@ -1,6 +1,15 @@
 import random
-import itertools
-import tourney
+import argparse
+import multiprocessing
+import collections
+import os
+import gzip
+import tempfile
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import numpy
 import tourney_sim
 from deap import base, creator, tools
 NUM_PLAYERS = 12
@@ -14,6 +23,23 @@ TEST_STATISTIC = 'win_share'
 SEEDED = False
 REPEAT_PENALTY_COEFFICIENT = 0.005
 MISMATCH_PENALTY_COEFFICIENT = 0.005
+DEFAULT_WORKERS = 1
+DEFAULT_CACHE_SIZE = 10000
+# samples added to a cached fitness each time its individual is selected
+# again, until it is based on MAX_FITNESS_SAMPLES samples
+FITNESS_REFINEMENT_SAMPLES = 5
+MAX_FITNESS_SAMPLES = 200
+# In racing mode, individuals are sampled RACING_STAGE_SAMPLES at a time;
+# after each stage, those whose mean fitness plus RACING_Z standard errors
+# falls below the mean minus RACING_Z standard errors of the kth best are
+# sampled no further.
+RACING_STAGE_SAMPLES = 5
+RACING_Z = 2.0
+SAMPLING_MODES = ('independent', 'common', 'racing')
+# the number of individuals simulated together with common samples
+COMMON_SAMPLING_CHUNK_SIZE = 50
+DEFAULT_CHECKPOINT_INTERVAL = 10
+CHECKPOINT_COMPRESSION_LEVEL = 1
 
 def repeat_penalty(num_of_matches):
     return num_of_matches**2 * REPEAT_PENALTY_COEFFICIENT
@@ -41,7 +67,7 @@ def mutate(x, indpb):
     for x_attr in x:
         tools.mutShuffleIndexes(x_attr, indpb)
 
-def evaluation_function(x):
+def card_system_of(x):
     card_system = []
     for r in x:
         r_without_byes = r[:r.index(NUM_PLAYERS)]
@@ -49,31 +75,185 @@ def evaluation_function(x):
             del r_without_byes[-1]
         card_system.append(
             tuple(zip(r_without_byes[::2], r_without_byes[1::2])))
-    card_system = tuple(card_system)
+    return tuple(card_system)
+
+def draw_abilities(num_samples):
+    abilities = numpy.random.normal(size=(num_samples, NUM_PLAYERS))
+    if SEEDED:
+        seeding = numpy.argsort(-(abilities + numpy.random.normal(0,
+            NOISE_FACTOR, abilities.shape)), axis=1)
+        abilities = numpy.take_along_axis(abilities, seeding, axis=1)
+    return abilities
+
+def sample_fitnesses(x, abilities, noise=None):
     final_card_rankings = {n : NUM_PLAYERS-n for n in range(NUM_PLAYERS)}
-    total_rank_coefficient = 0.0
-    for trial in range(FITNESS_SAMPLE_SIZE):
-        players = tourney_sim.get_players(NUM_PLAYERS)
-        if SEEDED:
-            players = [y[0] for y in
-                sorted([(p, p.ability + random.gauss(0, NOISE_FACTOR))
-                for p in players], key=lambda x:-x[1])]
-        t = tourney.PowerMatchedTournament(players, card_system=card_system,
-            final_card_rankings=final_card_rankings)
-        total_rank_coefficient += tourney_sim.test_harness(
-            t, NUM_ROUNDS, False)[TEST_STATISTIC]
-        for x, y in itertools.combinations(players, 2):
-            total_rank_coefficient -= repeat_penalty(
-                t.win_matrix_entry(x, y) + t.win_matrix_entry(y, x))
-    return total_rank_coefficient
-
-def selection_function(pop, k):
-    fitnesses = []
-    for p in pop:
-        fitnesses.append((p, evaluation_function(p)))
+    statistics, games = tourney_sim.simulate_power_matched_tournaments(
+        card_system_of(x), final_card_rankings, abilities, noise,
+        (TEST_STATISTIC,))
+    return (statistics[TEST_STATISTIC] -
+        repeat_penalty(numpy.triu(games, 1)).sum(axis=(1, 2)))
+
+# Returns an array of the fitnesses of each of the individuals xs on each
+# of the samples, simulating all of the tournaments at once.
+def common_sample_fitnesses(task):
+    xs, abilities, noise = task
+    num_samples = len(abilities)
+    cards = numpy.array([tourney_sim.card_system_array(card_system_of(x),
+        NUM_PLAYERS, NUM_PLAYERS // 2) for x in xs])
+    final_card_rankings = {n : NUM_PLAYERS-n for n in range(NUM_PLAYERS)}
+    statistics, games = tourney_sim.simulate_power_matched_tournaments(
+        numpy.repeat(cards, num_samples, axis=0), final_card_rankings,
+        numpy.tile(abilities, (len(xs), 1)),
+        numpy.tile(noise, (len(xs), 1, 1)), (TEST_STATISTIC,))
+    return (statistics[TEST_STATISTIC] -
+        repeat_penalty(numpy.triu(games, 1)).sum(axis=(1, 2))).reshape(
+        len(xs), num_samples)
+
+def evaluation_function(x, num_samples=FITNESS_SAMPLE_SIZE):
+    return float(sample_fitnesses(x, draw_abilities(num_samples)).sum())
+
+# Each evaluation is given its own seed for numpy.random, drawn from random
+# by the main process; the fitnesses are then the same however the
+# evaluations are spread across worker processes.
+def seeded_evaluation_function(task):
+    x, num_samples, seed = task
+    numpy.random.seed(seed)
+    return evaluation_function(x, num_samples)
+
+'''Least-recently-used cache of fitnesses keyed by the canonical (tupleize)
+form of the individuals.
+
+Each entry holds the total fitness over some number of samples, so that an
+estimate can be refined by adding further samples to it.  At most max_size
+entries are kept.
+'''
+class FitnessCache(object):
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self._max_size = max_size
+        self._entries = collections.OrderedDict()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def get(self, key):
+        """Returns the tuple (total fitness, number of samples) of the
+        given individual, or None if it is not cached."""
+        if key not in self._entries:
+            return None
+        entry = self._entries.pop(key)
+        self._entries[key] = entry
+        return entry
+    
+    def add(self, key, total, num_samples):
+        """Adds the total fitness of num_samples further samples of the
+        given individual and returns its new entry."""
+        old_total, old_num_samples = self._entries.pop(key, (0.0, 0))
+        entry = (old_total + total, old_num_samples + num_samples)
+        self._entries[key] = entry
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+def selection_function(pop, k, cache=None, sampling='independent'):
+    if sampling != 'independent':
+        fitnesses = common_fitnesses(pop, k, sampling == 'racing')
+    elif cache is None:
+        tasks = [(p, FITNESS_SAMPLE_SIZE, random.randrange(2**32))
+            for p in pop]
+        fitnesses = list(zip(pop, toolbox.map(seeded_evaluation_function,
+            tasks)))
+    else:
+        fitnesses = cached_fitnesses(pop, cache)
     random.shuffle(fitnesses)
     return [y[0] for y in sorted(fitnesses, key=lambda x:-x[1])[:k]]
 
+# Duplicates of an individual share a single fitness.  Individuals not yet
+# in the cache are evaluated on FITNESS_SAMPLE_SIZE samples and the others
+# are refined with FITNESS_REFINEMENT_SAMPLES more; either way the fitness
+# is the mean over all samples scaled to FITNESS_SAMPLE_SIZE samples, as
+# returned by evaluation_function.
+def cached_fitnesses(pop, cache):
+    keys = [tupleize(p) for p in pop]
+    entries = {}
+    tasks = []
+    task_keys = []
+    for p, key in zip(pop, keys):
+        if key in entries:
+            continue
+        entries[key] = cache.get(key)
+        if entries[key] is None:
+            num_samples = FITNESS_SAMPLE_SIZE
+        else:
+            num_samples = min(FITNESS_REFINEMENT_SAMPLES,
+                MAX_FITNESS_SAMPLES - entries[key][1])
+        if num_samples > 0:
+            tasks.append((p, num_samples, random.randrange(2**32)))
+            task_keys.append(key)
+    for key, task, total in zip(task_keys, tasks,
+        toolbox.map(seeded_evaluation_function, tasks)):
+        entries[key] = cache.add(key, total, task[1])
+    return [(p, entries[key][0] / entries[key][1] * FITNESS_SAMPLE_SIZE)
+        for p, key in zip(pop, keys)]
+
+# Every individual of the generation is scored on the same
+# FITNESS_SAMPLE_SIZE samples of abilities and game noise, so that the
+# differences between their fitnesses are due to the card systems rather
+# than the samples.  Duplicates of an individual are scored once.  With
+# racing, individuals that are clearly not among the k best are dropped
+# after each stage of RACING_STAGE_SAMPLES samples, their fitness being
+# the mean over the samples they got.
+def common_fitnesses(pop, k, racing):
+    keys = [tupleize(p) for p in pop]
+    individuals = {}
+    counts = {}
+    for p, key in zip(pop, keys):
+        individuals.setdefault(key, p)
+        counts[key] = counts.get(key, 0) + 1
+    numpy.random.seed(random.randrange(2**32))
+    abilities = draw_abilities(FITNESS_SAMPLE_SIZE)
+    noise = numpy.random.normal(size=(FITNESS_SAMPLE_SIZE, NUM_ROUNDS,
+        NUM_PLAYERS // 2))
+    if racing:
+        stage_ends = list(range(RACING_STAGE_SAMPLES, FITNESS_SAMPLE_SIZE,
+            RACING_STAGE_SAMPLES)) + [FITNESS_SAMPLE_SIZE]
+    else:
+        stage_ends = [FITNESS_SAMPLE_SIZE]
+    samples = {key: numpy.zeros(0) for key in individuals}
+    sampled_keys = sorted(individuals.keys())
+    start = 0
+    for end in stage_ends:
+        chunks = [sampled_keys[i:i + COMMON_SAMPLING_CHUNK_SIZE]
+            for i in range(0, len(sampled_keys), COMMON_SAMPLING_CHUNK_SIZE)]
+        tasks = [([individuals[key] for key in chunk], abilities[start:end],
+            noise[start:end]) for chunk in chunks]
+        for chunk, values in zip(chunks,
+            toolbox.map(common_sample_fitnesses, tasks)):
+            for key, key_values in zip(chunk, values):
+                samples[key] = numpy.concatenate((samples[key], key_values))
+        start = end
+        if racing and end < FITNESS_SAMPLE_SIZE:
+            sampled_keys = racing_survivors(sampled_keys, samples, counts, k)
+    return [(p, samples[key].mean() * FITNESS_SAMPLE_SIZE)
+        for p, key in zip(pop, keys)]
+
+def racing_survivors(sampled_keys, samples, counts, k):
+    means = {}
+    errors = {}
+    for key, values in samples.items():
+        means[key] = values.mean()
+        errors[key] = RACING_Z * values.std(ddof=1) / len(values)**0.5
+    # the lower bound of the kth best individual, counting duplicates
+    selected = 0
+    for key in sorted(samples, key=lambda x: -(means[x] - errors[x])):
+        selected += counts[key]
+        if selected >= k:
+            threshold = means[key] - errors[key]
+            break
+    else:
+        return sampled_keys
+    return [key for key in sampled_keys
+        if means[key] + errors[key] >= threshold]
+
 #toolbox.register("evaluate", evaluation_function)
 toolbox.register("mate", mate)
 toolbox.register("mutate", mutate, indpb=0.1)
@@ -103,12 +283,103 @@ def tupleize(p):
         result.append(tuple(sorted(r_paired)))
     return tuple(result)
 
-def main():
+'''Raised when resuming from a checkpoint with a sampling mode or cache size
+other than those of the run that saved it.'''
+class CheckpointMismatchError(ValueError):
+    pass
+
+# A checkpoint is a gzipped pickle of a dict holding the number of the
+# last generation completed, the population, the states of random and
+# numpy.random, the fitness cache and the sampling mode and cache size of
+# the run.  It is written to a temporary file in the same directory which
+# then replaces the checkpoint, so that an interrupted write leaves the
+# previous checkpoint intact.
+def save_checkpoint(path, generation, pop, cache, sampling, cache_size):
+    state = {'generation': generation, 'population': pop,
+        'random_state': random.getstate(),
+        'numpy_random_state': numpy.random.get_state(), 'cache': cache,
+        'sampling': sampling, 'cache_size': cache_size}
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb',
+                compresslevel=CHECKPOINT_COMPRESSION_LEVEL) as g:
+                pickle.dump(state, g, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file readable by its owner only; give it the
+        # permissions of any other file created under the umask
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        # os.replace is not available in Python 2, where os.rename
+        # replaces the file atomically on POSIX systems
+        getattr(os, 'replace', os.rename)(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+def load_checkpoint(path):
+    with gzip.open(path, 'rb') as g:
+        return pickle.load(g)
+
+# The sampling mode and cache size default to those of the checkpoint when
+# resuming (or to 'independent' and DEFAULT_CACHE_SIZE otherwise); giving
+# different ones is an error, as the resumed run would then differ from an
+# uninterrupted one.
+def main(workers=DEFAULT_WORKERS, seed=None, cache_size=None,
+    sampling=None, checkpoint_path=None,
+    checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, resume=False):
+    if resume:
+        state = load_checkpoint(checkpoint_path)
+        for name, value in (('sampling', sampling),
+            ('cache_size', cache_size)):
+            if value is not None and value != state[name]:
+                raise CheckpointMismatchError(
+                    "The checkpoint was saved with {0} {1!r}, "
+                    "not {2!r}".format(name, state[name], value))
+        sampling = state['sampling']
+        cache_size = state['cache_size']
+        random.setstate(state['random_state'])
+        numpy.random.set_state(state['numpy_random_state'])
+        pop = state['population']
+        first_generation = state['generation'] + 1
+        cache = state['cache']
+    else:
+        if sampling is None:
+            sampling = 'independent'
+        if cache_size is None:
+            cache_size = DEFAULT_CACHE_SIZE
+        random.seed(seed)
+        pop = None
+        first_generation = 1
+        cache = FitnessCache(cache_size) if cache_size > 0 else None
+    toolbox.register("select", selection_function,
+        k=POPULATION_SIZE // REDUCTION_FACTOR, cache=cache,
+        sampling=sampling)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        toolbox.register("map", pool.map)
+    try:
+        evolve(pop, first_generation, cache, checkpoint_path,
+            checkpoint_interval, sampling, cache_size)
+    finally:
+        if workers > 1:
+            pool.close()
+            pool.join()
+            toolbox.register("map", map)
+
+def evolve(pop=None, first_generation=1, cache=None, checkpoint_path=None,
+    checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, sampling='independent',
+    cache_size=DEFAULT_CACHE_SIZE):
     CROSSOVER_PROBABILITY = 0.5
     MUTATION_PROBABILITY = 0.2
-    pop = toolbox.population(n=POPULATION_SIZE)
+    if pop is None:
+        pop = toolbox.population(n=POPULATION_SIZE)
     
-    for generation in range(1, NUM_GENERATIONS + 1):
+    for generation in range(first_generation, NUM_GENERATIONS + 1):
         print("Starting generation {}".format(generation))
         offspring = toolbox.select(pop)
         tmp = offspring[:]
@@ -127,6 +398,44 @@ def main():
         
         pop[:] = offspring
         print_generation([tupleize(p) for p in pop])
+        
+        if checkpoint_path is not None and (
+            generation % checkpoint_interval == 0 or
+            generation == NUM_GENERATIONS):
+            save_checkpoint(checkpoint_path, generation, pop, cache,
+                sampling, cache_size)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description='Evolve a power-matching card system')
+    parser.add_argument('--workers', type=int, dest='workers',
+        default=DEFAULT_WORKERS,
+        help='the number of processes evaluating fitnesses')
+    parser.add_argument('--seed', type=int, dest='seed', default=None,
+        help='the random seed')
+    parser.add_argument('--cache-size', type=int, dest='cache_size',
+        default=None,
+        help='the number of fitnesses to cache, or 0 for no cache '
+        '(default {0}, or that of the checkpoint with --resume)'.format(
+        DEFAULT_CACHE_SIZE))
+    parser.add_argument('--sampling', choices=SAMPLING_MODES,
+        dest='sampling', default=None,
+        help='independent samples for each individual (using the cache), '
+        'common samples for the whole generation, or common samples with '
+        'racing (default independent, or that of the checkpoint with '
+        '--resume)')
+    parser.add_argument('--checkpoint', dest='checkpoint_path',
+        default=None, help='the file to save checkpoints to')
+    parser.add_argument('--checkpoint-interval', type=int,
+        dest='checkpoint_interval', default=DEFAULT_CHECKPOINT_INTERVAL,
+        help='the number of generations between checkpoints')
+    parser.add_argument('--resume', action='store_true', dest='resume',
+        help='resume from the checkpoint file')
+    args = parser.parse_args()
+    if args.resume and args.checkpoint_path is None:
+        parser.error('--resume requires --checkpoint')
+    try:
+        main(args.workers, args.seed, args.cache_size, args.sampling,
+            args.checkpoint_path, args.checkpoint_interval, args.resume)
+    except CheckpointMismatchError as e:
+        parser.error(str(e))
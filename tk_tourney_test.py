@@ -1,5 +1,6 @@
 import tourney
 import tourney_sim
+import numpy
 import Tkinter as tk
 import ttk
 
@@ -42,18 +43,29 @@ class TourneySimApplication(ttk.Frame):
     
     def run_tournament(self):
         players = tourney_sim.get_players(self.num_players)
-        t = tourney.MatchingPairedTournament(players, weight_function2)
+        t = tourney.MatchingPairedTournament(players, weight_function2,
+            batch_weight_function2)
         print("Starting a tournament with {0} players and {1} rounds".format(
             self.num_players, self.num_rounds))
         tourney_sim.test_harness(t, self.num_rounds, verbose=True)
 
 def weight_function2(t, x, y):
-    num_previous_matches = t.win_matrix_entry(x, y) + t.win_matrix_entry(y, x)
+    num_previous_matches = t.games_played_entry(x, y)
     repeat_penalty = 0 if num_previous_matches == 0 else (
         2 * num_previous_matches + 1)
-    score_penalty = 2 * abs(t.score_table[x] - t.score_table[y])
+    score_penalty = 2 * abs(t.score_table_view[x] - t.score_table_view[y])
     return -(repeat_penalty + score_penalty)
 
+def batch_weight_function2(t):
+    num_previous_matches = t.games_array
+    repeat_penalty = numpy.where(num_previous_matches == 0, 0,
+        2 * num_previous_matches + 1)
+    scores = t.score_array
+    score_penalty = 2 * numpy.abs(numpy.subtract.outer(scores, scores))
+    feasible = numpy.ones(num_previous_matches.shape, dtype=bool)
+    numpy.fill_diagonal(feasible, False)
+    return -(repeat_penalty + score_penalty), feasible
+
 def main():
     app = TourneySimApplication()
     app.master.title("Tourney simulation")
@@ -1,6 +1,11 @@
 import random
-import networkx as nx
 import itertools
+import numpy
+import tourney_matching
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
 """
 Special exception class to handle a paired tournament created with an
 odd number of players.
@@ -51,6 +56,7 @@ of one or more players who are declared winners based upon the scoreboard
 """
 class PairedTournament(object):
     MODIFIED_BRADLEY_TERRY_EPSILON = 1e-5
+    MODIFIED_BRADLEY_TERRY_METHOD = 'newton'
     
     def __init__(self, players, *args, **kwargs):
         if len(players) % 2 != 0:
@@ -58,54 +64,134 @@ class PairedTournament(object):
 "Algorithm must have an even number of players; {0} provided".format(
 len(players)))
         self._players = players[:]
+        self._player_tuple = tuple(players)
         self._scoreboard = []
         self._rounds_complete = 0
-        self._win_matrix = (
-            {(x, y):0 for x in self._players for y in self._players})
-        self._score_table = {x:0 for x in self._players}
-        self._modified_bradley_terry_ratings = {x:1.0 for x in self._players}
+        # Each player is identified by its position in self._players; the
+        # win matrix and score table are dense arrays indexed by position
+        # rather than dicts keyed by player (or player tuple).
+        self._player_indices = {self._players[i]:i
+            for i in range(len(self._players))}
+        self._win_array = numpy.zeros((len(self._players),
+            len(self._players)), dtype=numpy.int32)
+        self._score_array = numpy.zeros(len(self._players), dtype=numpy.int32)
+        # Symmetric count of games played between each pair of players,
+        # i.e. the win array plus its transpose, kept up to date by
+        # push_results.
+        self._games_array = numpy.zeros((len(self._players),
+            len(self._players)), dtype=numpy.int32)
+        self._modified_bradley_terry_array = numpy.ones(len(self._players))
+        self._modified_bradley_terry_iterations = 0
         self._is_modified_bradley_terry_dirty = False
+        self._score_table_view = _ScoreTableView(self)
+        self._win_matrix_view = _WinMatrixView(self)
+        self._scoreboard_view = _SequenceView(self._scoreboard)
+        # A profiler (see tourney_profile) may be given as the profiler
+        # keyword argument; it instruments this tournament only.
+        self._profiler = None
+        profiler = kwargs.pop('profiler', None)
         self.do_tournament_initialization(*args, **kwargs)
+        if profiler is not None:
+            profiler.attach(self)
     
     @property
     def players(self):
         return self._players[:]
     
+    @property
+    def profiler(self):
+        return self._profiler
+    
+    # The *_view properties give read-only access to the players, scoreboard,
+    # score table and win matrix without copying them; unlike the copies
+    # returned by the corresponding properties, the views reflect results
+    # pushed later.
+    
+    @property
+    def players_view(self):
+        return self._player_tuple
+    
+    def player_index(self, player):
+        """Returns the integer index of the player.
+        
+        Indices run from 0 to len(players) - 1 in the order in which the
+        players were given to the tournament, and are the row and column
+        indices of the underlying win and score arrays."""
+        return self._player_indices[player]
+    
     # scoreboard is a list of frozenset of tuple
     @property
     def scoreboard(self):
         return [r for r in self._scoreboard]
     
+    @property
+    def scoreboard_view(self):
+        return self._scoreboard_view
+    
     @property
     def rounds_complete(self):
         return self._rounds_complete
     
     @property
     def score_table(self):
-        """table = {}
-        for p in self.players:
-            table[p] = 0
-        for result in self.scoreboard:
-            for match in result:
-                table[match[0]] += 1
-        return table"""
-        return self._score_table.copy()
+        scores = self._score_array.tolist()
+        return {self._players[i]:scores[i] for i in range(len(scores))}
+    
+    @property
+    def score_table_view(self):
+        return self._score_table_view
     
     def score_table_entry(self, player):
-        return self._score_table[player]
+        return int(self._score_array[self._player_indices[player]])
     
     @property
     def win_matrix(self):
-        return self._win_matrix.copy()
+        wins = self._win_array.tolist()
+        return {(x, y):wins[i][j] for i, x in enumerate(self._players)
+            for j, y in enumerate(self._players)}
+    
+    @property
+    def win_matrix_view(self):
+        return self._win_matrix_view
     
     def win_matrix_entry(self, first_player, second_player):
-        return self._win_matrix[(first_player, second_player)]
+        return int(self._win_array[self._player_indices[first_player],
+            self._player_indices[second_player]])
+    
+    @property
+    def win_array(self):
+        """Read-only array of win counts indexed by player index.
+        
+        Entry [i, j] is the number of times the player with index i has
+        beaten the player with index j.  This is a view of the tournament's
+        own storage, so it reflects later results without being copied."""
+        return _read_only_view(self._win_array)
+    
+    @property
+    def score_array(self):
+        """Read-only array of the number of wins of each player, indexed by
+        player index."""
+        return _read_only_view(self._score_array)
+    
+    @property
+    def games_array(self):
+        """Read-only symmetric array of the number of games played between
+        each pair of players, indexed by player index."""
+        return _read_only_view(self._games_array)
+    
+    def games_played_entry(self, first_player, second_player):
+        return int(self._games_array[self._player_indices[first_player],
+            self._player_indices[second_player]])
     
     def push_results(self, results):
         self._scoreboard.append(results[:])
         for game in results:
-            self._win_matrix[tuple(game)] += 1
-            self._score_table[game[0]] += 1
+            winner = self._player_indices[game[0]]
+            loser = self._player_indices[game[1]]
+            self._win_array[winner, loser] += 1
+            self._games_array[winner, loser] += 1
+            self._games_array[loser, winner] += 1
+            self._score_array[winner] += 1
         self._rounds_complete += 1
         self._is_modified_bradley_terry_dirty = True
     
@@ -141,59 +227,80 @@ len(players)))
     and R. A. Bradley, "Science, Statistics, and Paired Comparisons" (1975)
     available at
     http://stat.fsu.edu/techreports/scanned%20in%20reports/M337.pdf
+    
+    The ratings are solved for with modified_bradley_terry_solve, starting
+    from the ratings computed after the previous round, using the method
+    named by MODIFIED_BRADLEY_TERRY_METHOD.
     """
     def modified_bradley_terry_ratings(self, player=None):
-        if not self._is_modified_bradley_terry_dirty:
-		    if player is None:
-		        return self._modified_bradley_terry_ratings.copy()
-		    else:
-		        return self._modified_bradley_terry_ratings[player]
-        old_ratings = self._modified_bradley_terry_ratings
-        done = False
-        while not done:
-            new_ratings = {x:(self.score_table_entry(x) + 0.5)/
-                (sum([0 if y == x else
-                (self.win_matrix_entry(x, y) + self.win_matrix_entry(y, x)) /
-                (old_ratings[x] + old_ratings[y])
-                for y in self.players]) + (1 / (1 + old_ratings[x])))
-                for x in self.players}
-            s = sum(new_ratings.values())
-            done = True
-            for x in self.players:
-                if abs(new_ratings[x] - old_ratings[x]) > (
-                    self.MODIFIED_BRADLEY_TERRY_EPSILON):
-                    done = False
-                    break
-            old_ratings = new_ratings
-        self._modified_bradley_terry_ratings = new_ratings
-        self._is_modified_bradley_terry_dirty = False
+        ratings_array = self.modified_bradley_terry_rating_array()
         if player is None:
-		    return new_ratings.copy()
+            ratings = ratings_array.tolist()
+            return {self._players[i]:ratings[i] for i in range(len(ratings))}
         else:
-            return new_ratings[player]
+            return float(ratings_array[self._player_indices[player]])
+    
+    def modified_bradley_terry_rating_array(self):
+        """Returns a read-only array of the modified Bradley-Terry ratings
+        indexed by player index."""
+        if self._is_modified_bradley_terry_dirty:
+            ratings, iterations = modified_bradley_terry_solve(
+                self._games_array, self._score_array,
+                self._modified_bradley_terry_array,
+                self.MODIFIED_BRADLEY_TERRY_EPSILON,
+                self.MODIFIED_BRADLEY_TERRY_METHOD)
+            self._modified_bradley_terry_array = ratings
+            self._modified_bradley_terry_iterations = iterations
+            self._is_modified_bradley_terry_dirty = False
+        return _read_only_view(self._modified_bradley_terry_array)
+
+"""Returns the round-robin schedule of the circle method for an even
+number of players.
+
+The schedule is an integer array of shape (num_players - 1,
+num_players // 2, 2): entry [r, k] holds the indices of the two players
+of the kth pair in round r.  Player 0 is fixed and plays player
+num_players - r - 1 in round r; the other players rotate around it.
+"""
+def round_robin_schedule(num_players):
+    rounds = numpy.arange(num_players - 1)
+    offsets = numpy.arange(num_players // 2)
+    k = (num_players - rounds - 1)[:, numpy.newaxis]
+    x = k + offsets
+    x = numpy.where(x >= num_players, x - (num_players - 1), x)
+    y = k - offsets
+    y = numpy.where(y <= 0, y + (num_players - 1), y)
+    x[:, 0] = 0
+    return numpy.stack((x, y), axis=-1)
 
 class RoundRobinPairedTournament(PairedTournament):
+    # schedules by number of players, shared by all tournaments
+    _schedules = {}
+    
     def do_tournament_initialization(self, *args, **kwargs):
-        pass
+        n = len(self._players)
+        if n not in self._schedules:
+            self._schedules[n] = _read_only_view(round_robin_schedule(n))
+        self._schedule = self._schedules[n]
+    
+    @property
+    def schedule(self):
+        """Read-only array of the index pairs of every round; see
+        round_robin_schedule."""
+        return self._schedule
+    
+    def next_pairing_indices(self):
+        """Returns the next pairing as a read-only array of shape
+        (n // 2, 2) of player index pairs."""
+        return self._schedule[self.rounds_complete % len(self._schedule)]
     
     def next_pairing(self):
-        r = self.rounds_complete % (len(self.players) - 1)
-        pairings = set()
-        k = len(self.players) - r - 1
-        pairings.add(frozenset([self.players[0],
-            self._players[k]]))
-        for i in range(1, len(self.players)/2):
-            x = k + i
-            if x >= len(self.players):
-                x -= len(self.players) - 1
-            y = k - i
-            if y <= 0:
-                y += len(self.players) - 1
-            pairings.add(frozenset([self.players[x], self.players[y]]))
-        return frozenset(pairings)
+        players = self.players_view
+        return frozenset(frozenset([players[x], players[y]])
+            for x, y in self.next_pairing_indices().tolist())
     
     def ranking(self):
-        return {x: self.score_table_entry(x) for x in self.players}
+        return {x: self.score_table_entry(x) for x in self.players_view}
 
 class SwissPairedTournament(PairedTournament):
     def do_tournament_initialization(self, *args, **kwargs):
@@ -201,29 +308,31 @@ class SwissPairedTournament(PairedTournament):
             self._total_rounds = kwargs['total_rounds']
         else:
             r = 0
-            p = len(self.players) - 1
+            p = len(self.players_view) - 1
             while p > 0:
                 r += 1
                 p >>= 1
             self._total_rounds = r
+        # Random generator used for any random choices in pairing; the
+        # random module is used if none is given.
+        self._rng = kwargs.get('rng')
     
     @property
     def total_rounds(self):
         return self._total_rounds
     
     def have_met(self, p, q):
-        if p not in self.players or q not in self.players:
+        i = self._player_indices.get(p)
+        j = self._player_indices.get(q)
+        if i is None or j is None:
             return False
-        for r in self.scoreboard:
-            if (p, q) in r or (q, p) in r:
-                return True
-        return 
+        return bool(self._games_array[i, j] > 0)
     
     def next_pairing(self):
         raise NotImplementedError
     
     def ranking(self):
-        return {x: self.score_table_entry(x) for x in self.players}
+        return {x: self.score_table_entry(x) for x in self.players_view}
 
 """
 Implementation of Swiss pairs.
@@ -231,10 +340,13 @@ Implementation of Swiss pairs.
 Pairings occur from high score group to low.  Within each score group,
 the pairings are random.  This algorithm makes no attempt to avoid
 repeat pairings.
+
+The pairings are reproducible if a seeded random generator, such as a
+numpy RandomState or Generator, is passed as the rng keyword argument.
 """
 class RandomSwissPairedTournamentWithRepeats(SwissPairedTournament):
     def next_pairing(self):
-        table = self.score_table
+        table = self.score_table_view
         score_groups = {}
         for player, wins in table.items():
             if wins in score_groups.keys():
@@ -244,8 +356,11 @@ class RandomSwissPairedTournamentWithRepeats(SwissPairedTournament):
         candidates = []
         high_score = max(score_groups.keys())
         for score in reversed(sorted(score_groups.keys())):
-            players_in_group = list(score_groups[score])
-            random.shuffle(players_in_group)
+            # Sets are ordered by hash, so order the group by position
+            # before shuffling to make the shuffle reproducible.
+            players_in_group = sorted(score_groups[score],
+                key=self._player_indices.__getitem__)
+            (self._rng or random).shuffle(players_in_group)
             candidates.extend([(p, score) for p in players_in_group])
         return self.do_pairing(candidates, high_score)
     
@@ -258,6 +373,118 @@ class RandomSwissPairedTournamentWithRepeats(SwissPairedTournament):
             pairings.add(frozenset([p1[0], p2[0]]))
         return frozenset(pairings)
 
+"""
+Implementation of Swiss pairs without repeat pairings.
+
+Players are ranked by score and then by their order in the list of players,
+which serves as the seeding.  Pairings are made from the top down: the
+highest ranked unpaired player is paired within their score group in the
+Dutch style, i.e. with the player halfway down what remains of the group,
+so that the top half of each group plays the bottom half.  A player who
+cannot be paired within their group floats down to the highest ranked
+player available in the next group.
+
+Players who have already met are never paired again.  When a choice leads
+to a dead end, the pairing backtracks to the next candidate; a partial
+pairing is abandoned as soon as some unpaired player has no remaining
+opponent they have not met.  The search is bounded by MAX_SEARCH_NODES
+partial pairings.  If it finds no pairing within the bound, the pairing is
+a maximum-weight matching, by the matching backend (a DenseMatchingBackend
+unless one is given as the matching_backend keyword argument), of the
+players who have not met, minimizing the total score difference between
+paired players.  Only if no such pairing exists are repeats allowed, and
+then the matching first minimizes the number of times the paired players
+have met before.
+"""
+class SwissPairedTournamentWithoutRepeats(SwissPairedTournament):
+    MAX_SEARCH_NODES = 10000
+    
+    def do_tournament_initialization(self, *args, **kwargs):
+        super(SwissPairedTournamentWithoutRepeats,
+            self).do_tournament_initialization(*args, **kwargs)
+        self._matching_backend = kwargs.get('matching_backend')
+        if self._matching_backend is None:
+            self._matching_backend = tourney_matching.DenseMatchingBackend()
+    
+    def next_pairing(self):
+        scores = self._score_array.tolist()
+        ranked = sorted(range(len(self._players)),
+            key=lambda i: (-scores[i], i))
+        pairs = self._search_pairing(ranked, scores)
+        if pairs is None:
+            pairs = self._matching_pairing()
+        return frozenset(frozenset([self._players[i], self._players[j]])
+            for i, j in pairs)
+    
+    def _candidates(self, remaining, scores):
+        """Returns the possible opponents of the first of the remaining
+        players (given by index in rank order) in order of preference."""
+        score = scores[remaining[0]]
+        m = 1
+        while m < len(remaining) and scores[remaining[m]] == score:
+            m += 1
+        half = max(m//2, 1)
+        return remaining[half:m] + remaining[1:half][::-1] + remaining[m:]
+    
+    def _search_pairing(self, ranked, scores):
+        available = (self._games_array == 0).astype(int)
+        numpy.fill_diagonal(available, 0)
+        # number of unpaired players each player has not yet met
+        opponent_counts = available.sum(axis=1)
+        if opponent_counts.min() == 0:
+            return None
+        pairs = []
+        removed_counts = []
+        # Depth-first search: each entry of the stack holds the players
+        # left to pair and an iterator over the first one's candidates.
+        stack = [(ranked, iter(self._candidates(ranked, scores)))]
+        nodes_left = self.MAX_SEARCH_NODES
+        while len(stack) > 0:
+            remaining, candidates = stack[-1]
+            first = remaining[0]
+            for second in candidates:
+                if not available[first, second]:
+                    continue
+                if nodes_left <= 0:
+                    return None
+                nodes_left -= 1
+                rest = [x for x in remaining if x != first and x != second]
+                if len(rest) == 0:
+                    pairs.append((first, second))
+                    return pairs
+                removed = available[:, first] + available[:, second]
+                opponent_counts -= removed
+                if opponent_counts[rest].min() > 0:
+                    pairs.append((first, second))
+                    removed_counts.append(removed)
+                    stack.append((rest, iter(self._candidates(rest, scores))))
+                    break
+                opponent_counts += removed
+            else:
+                stack.pop()
+                if len(pairs) > 0:
+                    pairs.pop()
+                    opponent_counts += removed_counts.pop()
+        return None
+    
+    def _matching_pairing(self):
+        scores = self._score_array
+        games = self._games_array
+        differences = numpy.abs(numpy.subtract.outer(scores, scores))
+        feasible = games == 0
+        numpy.fill_diagonal(feasible, False)
+        mate = self._matching_backend.match(-differences, feasible)
+        if (mate < 0).any():
+            # Each previous game between a pair costs more than the total
+            # score difference of any pairing, so the fewest previous games
+            # come first.
+            feasible = numpy.ones_like(feasible)
+            numpy.fill_diagonal(feasible, False)
+            repeat_cost = len(scores) // 2 * differences.max() + 1
+            mate = self._matching_backend.match(
+                -(differences + repeat_cost * games), feasible)
+        return [(i, j) for i, j in enumerate(mate.tolist()) if j > i]
+
 '''Abstract tournament where maximum-weight matchings determine pairings.
 
 This class sets up a framework for tournaments in which pairings are
@@ -268,50 +495,157 @@ class MatchingPairedTournament(PairedTournament):
     '''Creates the tournament with the given weight function.
     
     Creates a tournament with the given weight function.  The weight function
-    should have four parameters: two players, a win matrix (stored as a dict
-    with tuple keys), and a score table (stored as a dict).
+    should have three parameters: the tournament and two players.
     These are passed to the given function when weight(x, y) is called.
+    The weight function raises ImpossibleMatch if the two players may not
+    be paired.
+    
+    Optionally, a batch weight function may also be given.  It takes the
+    tournament as its only parameter and returns a tuple (weights, feasible)
+    of n-by-n arrays indexed by player index: weights[i, j] is the weight of
+    pairing the players with indices i and j and feasible[i, j] is True if
+    they may be paired at all.  Both arrays must be symmetric.  When a batch
+    weight function is given, it is used in place of the weight function
+    to compute all of the weights in a single call.
+    
+    The matching itself is computed by a matching backend (see
+    tourney_matching); by default, a DenseMatchingBackend.
+    
+    If incremental is True, the weights and feasibility of the last pairing
+    are kept, the matching backend is told which pairs have changed since,
+    and the default backend warm-starts each matching from the previous one
+    (see tourney_matching.DenseMatchingBackend).  With a batch weight
+    function, all of the weights are computed every round and compared with
+    those kept.  Without one, local_weights must be True, meaning that the
+    weight of a pair depends on nothing but the scores of the two players
+    and the number of games between them (as do the score difference and
+    repeat penalty weights, but not the Bradley-Terry ones); the weight
+    function is then only called again for the pairs in which one of those
+    has changed.  Otherwise the changed pairs cannot be found, and
+    incremental mode is refused with a ValueError.
     '''
-    def do_tournament_initialization(self, weight_function, *args, **kwargs):
+    def do_tournament_initialization(self, weight_function,
+        batch_weight_function=None, matching_backend=None, incremental=False,
+        local_weights=False, *args, **kwargs):
+        if (incremental and batch_weight_function is None and
+            not local_weights):
+            raise ValueError("Incremental mode needs a batch weight "
+                "function or local_weights=True")
         self._wf = weight_function
+        self._bwf = batch_weight_function
+        if matching_backend is None:
+            matching_backend = tourney_matching.DenseMatchingBackend(
+                warm_start=incremental)
+        self._matching_backend = matching_backend
+        self._incremental = incremental
+        # weights and feasibility of the last pairing in incremental mode,
+        # and the scores and games played they were computed from without
+        # a batch weight function
+        self._weights = None
+        self._feasible = None
+        self._weight_scores = None
+        self._weight_games = None
     
     def weight(self, first_player, second_player):
         return self._wf(self, first_player, second_player)
     
-    def next_pairing(self):
-        graph = nx.Graph()
-        graph.add_nodes_from(self.players)
-        edges = set()
-        for x in itertools.combinations(self.players, 2):
+    def weight_matrix(self):
+        '''Returns the weights and feasibility of all pairs of players.
+        
+        The result is a tuple (weights, feasible) of n-by-n arrays indexed
+        by player index, as returned by a batch weight function.  If no
+        batch weight function was given, the weight function is called once
+        per pair of players instead.
+        '''
+        if self._bwf is not None:
+            return self._bwf(self)
+        n = len(self._players)
+        rows, columns = numpy.triu_indices(n, 1)
+        return self._evaluate_weights(rows, columns,
+            numpy.zeros((n, n), dtype=int), numpy.zeros((n, n), dtype=bool))
+    
+    def _updated_weight_matrix(self):
+        # Returns (weights, feasible, changed) for next_pairing, where changed
+        # marks the pairs whose weights may have changed since the last
+        # pairing, or is None if all of them may have.  Only next_pairing
+        # updates the weights kept in incremental mode, so that changed is
+        # always relative to the last matching.
+        if not self._incremental:
+            weights, feasible = self.weight_matrix()
+            return weights, feasible, None
+        if self._bwf is not None:
+            weights, feasible = self._bwf(self)
+            if self._weights is None:
+                changed = None
+            else:
+                changed = ((weights != self._weights) |
+                    (feasible != self._feasible))
+            self._weights = numpy.array(weights)
+            self._feasible = numpy.array(feasible)
+            return weights, feasible, changed
+        if self._weights is None:
+            weights, feasible = self.weight_matrix()
+            changed = None
+        else:
+            scores = self._score_array
+            games = self._games_array
+            score_changed = scores != self._weight_scores
+            changed = (numpy.logical_or.outer(score_changed, score_changed) |
+                (games != self._weight_games))
+            numpy.fill_diagonal(changed, False)
+            rows, columns = numpy.nonzero(numpy.triu(changed, 1))
+            weights, feasible = self._evaluate_weights(rows, columns,
+                self._weights, self._feasible)
+        self._weights = weights
+        self._feasible = feasible
+        self._weight_scores = self._score_array.copy()
+        self._weight_games = self._games_array.copy()
+        return _read_only_view(weights), _read_only_view(feasible), changed
+    
+    def _evaluate_weights(self, rows, columns, weights, feasible):
+        # Calls the weight function for the pairs (rows[k], columns[k]) and
+        # stores the results (symmetrically) in weights and feasible.
+        values = []
+        for i, j in zip(rows.tolist(), columns.tolist()):
             try:
-                w = self.weight(x[0], x[1])
-                edges.add((x[0], x[1], w))
+                values.append(self.weight(self._players[i],
+                    self._players[j]))
+                feasible[i, j] = feasible[j, i] = True
             except ImpossibleMatch:
-                pass
-        graph.add_weighted_edges_from(edges)
-        matching_dict = nx.max_weight_matching(graph, maxcardinality=True)
-        pl = self.players[:]
-        pairing = set()
-        while len(pl) > 0:
-            p = pl.pop()
-            if p not in matching_dict:
-                raise NoValidPairingError
-            else:
-                pairing.add(frozenset([p, matching_dict[p]]))
-                pl.remove(matching_dict[p])
-        return frozenset(pairing)
+                values.append(0)
+                feasible[i, j] = feasible[j, i] = False
+        values = numpy.array(values)
+        if len(values) > 0:
+            weights = weights.astype(numpy.result_type(weights, values),
+                copy=False)
+            weights[rows, columns] = weights[columns, rows] = values
+        return weights, feasible
+    
+    def next_pairing(self):
+        weights, feasible, changed = self._updated_weight_matrix()
+        mate = self._matching_backend.match(weights, feasible, changed)
+        if (mate < 0).any():
+            raise NoValidPairingError
+        return frozenset(frozenset([self._players[i], self._players[mate[i]]])
+            for i in range(len(mate)) if mate[i] > i)
     
     def ranking(self):
         return self.modified_bradley_terry_ratings()
 
 class SwissPairsMatchingTournament(MatchingPairedTournament):
     def weight(self, first_player, second_player):
-        if (self.win_matrix_entry(first_player, second_player) +
-            self.win_matrix_entry(second_player, first_player)) > 0:
+        if self.games_played_entry(first_player, second_player) > 0:
             raise ImpossibleMatch
         else:
-            return -abs(self.score_table[first_player] -
-                self.score_table[second_player])
+            return -abs(self.score_table_view[first_player] -
+                self.score_table_view[second_player])
+    
+    def weight_matrix(self):
+        scores = self._score_array
+        weights = -numpy.abs(numpy.subtract.outer(scores, scores))
+        feasible = self._games_array == 0
+        numpy.fill_diagonal(feasible, False)
+        return weights, feasible
 
 class PowerMatchedTournament(PairedTournament):
     """Initialize a power-matched tournament with the given card
@@ -332,8 +666,8 @@ class PowerMatchedTournament(PairedTournament):
         self._card_system = tuple(card_system)
         self._final_card_rankings = dict(final_card_rankings)
         self._total_rounds = len(self._card_system)
-        self._current_cards = {self.players[i] : i
-            for i in range(len(self.players))}
+        self._current_cards = {self.players_view[i] : i
+            for i in range(len(self.players_view))}
     
     @property
     def current_cards(self):
@@ -362,7 +696,150 @@ class PowerMatchedTournament(PairedTournament):
     
     def ranking(self):
         return {x : self._final_card_rankings[self._current_cards[x]]
-            for x in self.players}
+            for x in self.players_view}
+
+class _ScoreTableView(Mapping):
+    """Read-only mapping of each player to the number of wins."""
+    def __init__(self, tournament):
+        self._tournament = tournament
+    
+    def __getitem__(self, player):
+        return self._tournament.score_table_entry(player)
+    
+    def __iter__(self):
+        return iter(self._tournament.players_view)
+    
+    def __len__(self):
+        return len(self._tournament.players_view)
+
+class _WinMatrixView(Mapping):
+    """Read-only mapping of each pair (x, y) of players to the number of
+    times x has beaten y."""
+    def __init__(self, tournament):
+        self._tournament = tournament
+    
+    def __getitem__(self, pair):
+        return self._tournament.win_matrix_entry(*pair)
+    
+    def __iter__(self):
+        players = self._tournament.players_view
+        return itertools.product(players, players)
+    
+    def __len__(self):
+        return len(self._tournament.players_view)**2
+
+class _SequenceView(Sequence):
+    """Read-only view of a list."""
+    def __init__(self, items):
+        self._items = items
+    
+    def __getitem__(self, index):
+        return self._items[index]
+    
+    def __len__(self):
+        return len(self._items)
+
+def _read_only_view(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+"""Solves for the modified Bradley-Terry ratings in matrix form.
+
+games is a symmetric array whose (x, y) entry is the number of games
+played between players x and y, scores is the array of wins of each player
+and initial_ratings is the starting point of the iteration (usually the
+ratings computed after the previous round).  Returns a tuple of the
+ratings array and the number of iterations performed.
+
+Two methods are available:
+* 'mm' is the fixed-point (minorization-maximization) iteration
+  r[x] = (s[x] + 0.5) / (sum_y g[x, y] / (r[x] + r[y]) + 1 / (1 + r[x])),
+  stopping when no rating changes by more than epsilon.
+* 'newton' takes damped Newton steps on the log-likelihood in terms of
+  the log-ratings, which is strictly concave thanks to the fictitious
+  games, stopping when a full step changes no rating by more than epsilon.
+  Newton's method converges quadratically, so its result is much closer
+  to the common fixed point than that of the 'mm' iteration.
+"""
+def modified_bradley_terry_solve(games, scores, initial_ratings, epsilon,
+    method='newton'):
+    games = numpy.asarray(games, dtype=float)
+    observed = numpy.asarray(scores, dtype=float) + 0.5
+    ratings = numpy.array(initial_ratings, dtype=float)
+    if method == 'mm':
+        return _modified_bradley_terry_mm(games, observed, ratings, epsilon)
+    elif method == 'newton':
+        return _modified_bradley_terry_newton(games, observed, ratings,
+            epsilon)
+    else:
+        raise ValueError("Unknown Bradley-Terry method {0!r}".format(method))
+
+def _modified_bradley_terry_mm(games, observed, ratings, epsilon):
+    iterations = 0
+    while True:
+        iterations += 1
+        new_ratings = observed / ((games /
+            numpy.add.outer(ratings, ratings)).sum(axis=1) +
+            1 / (1 + ratings))
+        done = numpy.abs(new_ratings - ratings).max() <= epsilon
+        ratings = new_ratings
+        if done:
+            return ratings, iterations
+
+NEWTON_FULL_STEP_IMPROVEMENT = 1e-8
+
+def _modified_bradley_terry_log_likelihood(theta, games, observed):
+    return (observed.dot(theta) -
+        0.5 * (games * numpy.logaddexp.outer(theta, theta)).sum() -
+        numpy.logaddexp(0, theta).sum())
+
+def _modified_bradley_terry_newton(games, observed, ratings, epsilon):
+    theta = numpy.log(ratings)
+    likelihood = _modified_bradley_terry_log_likelihood(theta, games,
+        observed)
+    iterations = 0
+    while True:
+        iterations += 1
+        # p[x, y] is the probability that x beats y; p0 that x beats the
+        # fictitious opponent
+        p = ratings[:, numpy.newaxis] / numpy.add.outer(ratings, ratings)
+        p0 = ratings / (1 + ratings)
+        gradient = observed - (games * p).sum(axis=1) - p0
+        off_diagonal = games * p * p.T
+        hessian = -off_diagonal
+        hessian[numpy.diag_indices_from(hessian)] += (
+            off_diagonal.sum(axis=1) + p0 * (1 - p0))
+        step = numpy.linalg.solve(hessian, gradient)
+        new_ratings = numpy.exp(theta + step)
+        if numpy.abs(new_ratings - ratings).max() <= epsilon:
+            return new_ratings, iterations
+        # backtrack until the log-likelihood increases sufficiently, unless
+        # the expected increase is so small that the full step is surely
+        # within the region of quadratic convergence; there, rounding
+        # errors in the log-likelihood could make the backtracking take
+        # tiny steps indefinitely
+        improvement = gradient.dot(step)
+        if improvement < NEWTON_FULL_STEP_IMPROVEMENT:
+            theta = theta + step
+            ratings = new_ratings
+            likelihood = _modified_bradley_terry_log_likelihood(theta,
+                games, observed)
+            continue
+        step_size = 1.0
+        while True:
+            new_theta = theta + step_size * step
+            new_likelihood = _modified_bradley_terry_log_likelihood(
+                new_theta, games, observed)
+            if new_likelihood >= likelihood + 1e-4 * step_size * improvement:
+                break
+            step_size /= 2
+            if step_size < 1e-10:
+                # no further progress is possible in floating point
+                return ratings, iterations
+        theta = new_theta
+        ratings = numpy.exp(theta)
+        likelihood = new_likelihood
 
 def reinstein_power_matching(num_players, num_rounds):
     pairs = []
@@ -0,0 +1,444 @@
+from __future__ import division
+import os
+import random
+import time
+import argparse
+import json
+import sys
+import gc
+import tourney
+import tourney_matching
+import tourney_sim
+import tourney_test
+
+DEFAULT_MATCHING_PLAYER_COUNTS = (20, 32, 64, 128, 256, 512)
+DEFAULT_MAX_NETWORKX_PLAYERS = 256
+DEFAULT_REPETITIONS = 3
+DEFAULT_SWISS_PLAYER_COUNTS = (32, 64, 128, 256, 512)
+DEFAULT_SUITE_PLAYER_COUNTS = (8, 16, 32, 64, 128, 256, 512)
+DEFAULT_TOLERANCE = 0.25
+# each suite benchmark is repeated until it has run for at least this long
+MIN_BENCHMARK_TIME = 0.2
+MAX_BENCHMARK_REPETITIONS = 100
+BASELINE_VERSION = 3
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# How peak memory is measured: the peak of the memory allocated by Python
+# with tracemalloc (Python 3.4 and later), otherwise the growth of the
+# peak resident set size of a forked process, or not at all.
+if tracemalloc is not None:
+    MEMORY_MEASURE = 'tracemalloc'
+elif resource is not None and hasattr(os, 'fork'):
+    MEMORY_MEASURE = 'maxrss'
+else:
+    MEMORY_MEASURE = None
+
+"""Returns the weight arrays of a tournament in progress.
+
+A round-robin tournament between num_players players is played for
+num_rounds rounds, after which the weights of the given batch weight
+function are computed for the resulting win matrix and score table.
+"""
+def tournament_weights(num_players, num_rounds, batch_weight_function):
+    players = tourney_sim.get_players(num_players)
+    t = tourney.MatchingPairedTournament(players, None,
+        batch_weight_function)
+    rr = tourney.RoundRobinPairedTournament(players)
+    for r in range(num_rounds):
+        results = tourney_sim.simulate_round(rr.next_pairing())
+        rr.push_results(results)
+        t.push_results(results)
+    return t.weight_matrix()
+
+def time_backend(backend, weights, feasible, repetitions):
+    best = None
+    for i in range(repetitions):
+        start = time.time()
+        mate = backend.match(weights, feasible)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    total = sum(weights[i, mate[i]] for i in range(len(mate)) if mate[i] > i)
+    return best, total
+
+"""Compares the matching backends on tournament weight arrays.
+
+For each player count, the weights after a few rounds are computed with
+the integer repeat-penalty weights (weight_function2) and the real-valued
+Bradley-Terry information weights (weight_function4), and each backend
+solves the resulting matching.  The best time of several repetitions is
+reported, along with the weight of each matching so that the results of
+the backends can be checked against each other.
+"""
+def benchmark_matching(player_counts=DEFAULT_MATCHING_PLAYER_COUNTS,
+    max_networkx_players=DEFAULT_MAX_NETWORKX_PLAYERS,
+    repetitions=DEFAULT_REPETITIONS):
+    backends = (('dense', tourney_matching.DenseMatchingBackend()),
+        ('networkx', tourney_matching.NetworkxMatchingBackend()))
+    weight_styles = (('wf2', tourney_test.batch_weight_function2),
+        ('wf4', tourney_test.batch_weight_function4))
+    print("Players Weights  Backend   Time (s)    Matching weight")
+    print("------- ------- -------- ---------- ------------------")
+    for num_players in player_counts:
+        for style, batch_weight_function in weight_styles:
+            weights, feasible = tournament_weights(num_players, 3,
+                batch_weight_function)
+            for name, backend in backends:
+                if name == 'networkx' and num_players > max_networkx_players:
+                    print("{0:7d} {1:7} {2:8} {3:>10}".format(num_players,
+                        style, name, 'skipped'))
+                    continue
+                elapsed, total = time_backend(backend, weights, feasible,
+                    repetitions)
+                print("{0:7d} {1:7} {2:8} {3:10.4f} {4:18.6f}".format(
+                    num_players, style, name, elapsed, total))
+
+"""Plays a Swiss tournament for the given number of rounds.
+
+Returns the total time spent pairing, the number of repeat pairings and
+the mean score difference between paired players, or None if the
+tournament could find no valid pairing.
+"""
+def play_swiss(t, num_rounds):
+    pairing_time = 0.0
+    repeats = 0
+    score_difference = 0
+    for r in range(num_rounds):
+        start = time.time()
+        try:
+            pairing = t.next_pairing()
+        except tourney.NoValidPairingError:
+            return None
+        pairing_time += time.time() - start
+        for pair in pairing:
+            x, y = tuple(pair)
+            if t.games_played_entry(x, y) > 0:
+                repeats += 1
+            score_difference += abs(t.score_table_entry(x) -
+                t.score_table_entry(y))
+        t.push_results(tourney_sim.simulate_round(pairing))
+    return (pairing_time, repeats,
+        score_difference / (num_rounds * len(t.players_view) // 2))
+
+"""Compares the Swiss pairing engines.
+
+For each player count, a Swiss tournament of num_rounds rounds (by default,
+enough rounds to find a winner) is played with SwissPairedTournamentWithout-
+Repeats and with SwissPairsMatchingTournament.  Both play the same players
+with the same random seed.  The time spent pairing is reported together
+with two measures of the quality of the pairings: the number of repeat
+pairings and the mean score difference between paired players.
+"""
+def benchmark_swiss(player_counts=DEFAULT_SWISS_PLAYER_COUNTS,
+    num_rounds=None):
+    engines = (('search', lambda players:
+            tourney.SwissPairedTournamentWithoutRepeats(players)),
+        ('matching', lambda players:
+            tourney.SwissPairsMatchingTournament(players, None)))
+    print("Players Rounds   Engine   Time (s) Repeats Score difference")
+    print("------- ------ -------- ---------- ------- ----------------")
+    for num_players in player_counts:
+        players = tourney_sim.get_players(num_players)
+        rounds = num_rounds
+        if rounds is None:
+            rounds = tourney.SwissPairedTournament(players).total_rounds
+        seed = random.random()
+        for name, engine in engines:
+            random.seed(seed)
+            result = play_swiss(engine(players), rounds)
+            if result is None:
+                print("{0:7d} {1:6d} {2:8} {3:>10}".format(num_players,
+                    rounds, name, 'no pairing'))
+            else:
+                print("{0:7d} {1:6d} {2:8} {3:10.4f} {4:7d} {5:16.4f}".format(
+                    num_players, rounds, name, *result))
+
+"""Returns the card system of a power-matched tournament between a power
+of two number of players, as used by PowerMatchedTournament.  In round r
+the cards are split into blocks of num_players >> r consecutive cards and
+each card is paired with its mirror image in its block, so the winners of
+a block play each other in the next round."""
+def bracket_card_system(num_players):
+    card_system = []
+    block = num_players
+    while block > 1:
+        card_system.append(frozenset((start + k, start + block - 1 - k)
+            for start in range(0, num_players, block)
+            for k in range(block // 2)))
+        block //= 2
+    return tuple(card_system)
+
+def _matching_tournament(weight_function, batch_weight_function):
+    return lambda players, rng: tourney.MatchingPairedTournament(players,
+        weight_function, batch_weight_function)
+
+def _power_matched_tournament(players, rng):
+    n = len(players)
+    return tourney.PowerMatchedTournament(players,
+        card_system=bracket_card_system(n),
+        final_card_rankings={c: n - c for c in range(n)})
+
+"""The tournaments of the benchmark suite, as (name, constructor) pairs.
+Each constructor takes the players and the random generator of the run,
+for any random choices in pairing.  The matching tournaments use the
+batch weight function corresponding to each weight function of
+tourney_test, as test4 does."""
+SUITE_TOURNAMENTS = (
+    ('round_robin', lambda players, rng:
+        tourney.RoundRobinPairedTournament(players)),
+    ('random_swiss', lambda players, rng:
+        tourney.RandomSwissPairedTournamentWithRepeats(players, rng=rng)),
+    ('swiss_matching', lambda players, rng:
+        tourney.SwissPairsMatchingTournament(players, None)),
+    ('matching_wf1', _matching_tournament(tourney_test.weight_function,
+        tourney_test.batch_weight_function)),
+    ('matching_wf2', _matching_tournament(tourney_test.weight_function2,
+        tourney_test.batch_weight_function2)),
+    ('matching_wf3', _matching_tournament(tourney_test.weight_function3,
+        tourney_test.batch_weight_function3)),
+    ('matching_wf4', _matching_tournament(tourney_test.weight_function4,
+        tourney_test.batch_weight_function4)),
+    ('matching_wf5', _matching_tournament(tourney_test.weight_function5,
+        tourney_test.batch_weight_function5)),
+    ('power_matched', _power_matched_tournament))
+
+"""Plays a full tournament of num_rounds rounds, with the players, any
+random pairings and the results drawn from a generator seeded with seed,
+and returns the times spent in each round (pairing and pushing the
+results) and in computing the final ranking."""
+def time_tournament(constructor, num_players, num_rounds, seed):
+    rng = tourney_sim.stream_rng(seed, num_players)
+    t = constructor(tourney_sim.get_players(num_players, rng), rng)
+    round_times = []
+    for r in range(num_rounds):
+        start = time.time()
+        pairing = t.next_pairing()
+        pairing_time = time.time() - start
+        results = tourney_sim.simulate_round(pairing, rng)
+        start = time.time()
+        t.push_results(results)
+        round_times.append(pairing_time + time.time() - start)
+    start = time.time()
+    t.ranking()
+    return round_times, time.time() - start
+
+"""Returns the peak memory in bytes used while playing the tournament of
+time_tournament, measured as MEMORY_MEASURE says, or None if it cannot be
+measured."""
+def peak_memory(constructor, num_players, num_rounds, seed):
+    if MEMORY_MEASURE == 'tracemalloc':
+        gc.collect()
+        tracemalloc.start()
+        try:
+            time_tournament(constructor, num_players, num_rounds, seed)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    elif MEMORY_MEASURE == 'maxrss':
+        return _forked_peak_rss(constructor, num_players, num_rounds, seed)
+    return None
+
+def _max_rss():
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else 1024 * max_rss
+
+"""Plays the tournament of time_tournament in a forked child and returns
+the peak resident set size of the child, which includes the memory of this
+process when forked, or None if the child failed.  The child measures
+itself, as the peak over the children of this process never decreases, and
+sends the result back through a pipe."""
+def _forked_peak_rss(constructor, num_players, num_rounds, seed):
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            gc.collect()
+            time_tournament(constructor, num_players, num_rounds, seed)
+            os.write(write_fd, str(_max_rss()).encode('ascii'))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return int(data) if data else None
+
+"""Benchmarks each of the named tournaments of SUITE_TOURNAMENTS (by
+default, all of them) at each player count.
+
+A full tournament is as many rounds as a Swiss tournament needs to find a
+winner.  The per-round latency is the mean time of a round and the
+tournament time includes the final ranking; both are the best of several
+repetitions with the same players and results, after one untimed run to
+warm up caches.  Fast benchmarks are repeated more than the given number
+of times, until they have run for MIN_BENCHMARK_TIME, to reduce noise.
+The peak memory is measured in a separate run (see peak_memory), as
+tracing allocations slows everything else.  Without tracemalloc, it is the
+peak resident set size of a forked process, which includes the memory of
+the benchmarks run before, so it is only comparable between runs of the
+same tournaments and player counts.
+Returns a dict mapping "name/players" to a dict of the measurements, as
+saved in a baseline file.
+"""
+def benchmark_suite(player_counts=DEFAULT_SUITE_PLAYER_COUNTS,
+    tournament_names=None, repetitions=DEFAULT_REPETITIONS, seed=None):
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    results = {}
+    print("  Tournament   Players Rounds Round (ms) Total (s) Peak memory")
+    print("-------------- ------- ------ ---------- --------- -----------")
+    for name, constructor in SUITE_TOURNAMENTS:
+        if tournament_names is not None and name not in tournament_names:
+            continue
+        for num_players in player_counts:
+            num_rounds = tourney.SwissPairedTournament(
+                list(range(num_players))).total_rounds
+            time_tournament(constructor, num_players, num_rounds, seed)
+            round_latency = None
+            tournament_time = None
+            elapsed = 0.0
+            runs = 0
+            while runs < repetitions or (elapsed < MIN_BENCHMARK_TIME and
+                runs < MAX_BENCHMARK_REPETITIONS):
+                round_times, ranking_time = time_tournament(constructor,
+                    num_players, num_rounds, seed)
+                latency = sum(round_times) / num_rounds
+                total = sum(round_times) + ranking_time
+                if round_latency is None or latency < round_latency:
+                    round_latency = latency
+                if tournament_time is None or total < tournament_time:
+                    tournament_time = total
+                elapsed += total
+                runs += 1
+            peak = peak_memory(constructor, num_players, num_rounds, seed)
+            results['{0}/{1}'.format(name, num_players)] = {
+                'round_latency': round_latency,
+                'tournament_time': tournament_time, 'peak_memory': peak}
+            print("{0:14} {1:7d} {2:6d} {3:10.3f} {4:9.4f} {5:>11}".format(
+                name, num_players, num_rounds, 1000 * round_latency,
+                tournament_time, 'n/a' if peak is None else peak))
+    return results
+
+"""Saves the results of benchmark_suite, run with the given seed, as a
+baseline file, together with the MEMORY_MEASURE of the peak memory."""
+def save_baseline(path, results, seed):
+    with open(path, 'w') as f:
+        json.dump({'version': BASELINE_VERSION, 'seed': seed,
+            'memory_measure': MEMORY_MEASURE, 'results': results}, f,
+            indent=1, sort_keys=True)
+
+"""Returns the contents of a baseline file: a dict of the seed, so that the
+suite can be run again with the same players and results, the memory
+measure and the results."""
+def load_baseline(path):
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError("Unsupported baseline version {0!r}".format(
+            baseline.get('version')))
+    return baseline
+
+"""Prints the ratio of each measurement to that of the baseline and
+returns the list of (benchmark, measurement, ratio) of the regressions,
+i.e. the ratios greater than 1 + tolerance.  Benchmarks missing from
+either are skipped, as are memory measurements missing from either, and
+all memory measurements unless compare_memory."""
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE,
+    compare_memory=True):
+    regressions = []
+    measurements = ('round_latency', 'tournament_time')
+    if compare_memory:
+        measurements += ('peak_memory',)
+    print("      Benchmark       Measurement      Ratio")
+    print("-------------------- --------------- -------")
+    for key in sorted(set(results) & set(baseline)):
+        for measurement in measurements:
+            new = results[key][measurement]
+            old = baseline[key][measurement]
+            if new is None or old is None or old == 0:
+                continue
+            ratio = new / old
+            flag = ''
+            if ratio > 1 + tolerance:
+                regressions.append((key, measurement, ratio))
+                flag = ' REGRESSION'
+            print("{0:20} {1:15} {2:7.3f}{3}".format(key, measurement,
+                ratio, flag))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark the tournament simulator')
+    parser.add_argument('benchmark', choices=['matching', 'swiss', 'suite'],
+        help='the benchmark to run')
+    parser.add_argument('--players', type=int, nargs='+',
+        dest='player_counts', default=None,
+        help='the numbers of players to benchmark')
+    parser.add_argument('--max-networkx-players', type=int,
+        dest='max_networkx_players', default=DEFAULT_MAX_NETWORKX_PLAYERS,
+        help='the largest number of players to run networkx on')
+    parser.add_argument('--repetitions', type=int, dest='repetitions',
+        default=DEFAULT_REPETITIONS,
+        help='the number of times to time each matching')
+    parser.add_argument('--rounds', type=int, dest='num_rounds',
+        default=None, help='the number of rounds of each Swiss tournament')
+    parser.add_argument('--seed', type=int, dest='seed', default=None,
+        help='the random seed')
+    parser.add_argument('--tournaments', nargs='+', dest='tournaments',
+        default=None, choices=[name for name, _ in SUITE_TOURNAMENTS],
+        help='the tournaments of the suite to benchmark')
+    parser.add_argument('--save-baseline', dest='save_baseline',
+        default=None, help='the file to save the results of the suite to')
+    parser.add_argument('--compare', dest='compare', default=None,
+        help='a baseline file to compare the results of the suite to, '
+        'run with the seed of the baseline; the exit status is 1 if any '
+        'regressed')
+    parser.add_argument('--tolerance', type=float, dest='tolerance',
+        default=DEFAULT_TOLERANCE,
+        help='the fraction by which a measurement may exceed the baseline '
+        'before it is flagged')
+    args = parser.parse_args()
+    random.seed(args.seed)
+    if args.benchmark == 'matching':
+        benchmark_matching(args.player_counts or
+            DEFAULT_MATCHING_PLAYER_COUNTS, args.max_networkx_players,
+            args.repetitions)
+    elif args.benchmark == 'swiss':
+        benchmark_swiss(args.player_counts or DEFAULT_SWISS_PLAYER_COUNTS,
+            args.num_rounds)
+    elif args.benchmark == 'suite':
+        seed = args.seed
+        if args.compare is not None:
+            baseline = load_baseline(args.compare)
+            baseline_seed = baseline['seed']
+            if seed is not None and seed != baseline_seed:
+                parser.error("--seed {0} differs from the seed {1} of the "
+                    "baseline".format(seed, baseline_seed))
+            seed = baseline_seed
+        elif seed is None:
+            seed = random.randrange(1 << 32)
+        results = benchmark_suite(args.player_counts or
+            DEFAULT_SUITE_PLAYER_COUNTS, args.tournaments, args.repetitions,
+            seed)
+        if args.save_baseline is not None:
+            save_baseline(args.save_baseline, results, seed)
+        if args.compare is not None:
+            print("")
+            compare_memory = baseline['memory_measure'] == MEMORY_MEASURE
+            if not compare_memory:
+                print("Peak memory not compared: measured by {0}, baseline "
+                    "by {1}".format(MEMORY_MEASURE,
+                    baseline['memory_measure']))
+            if compare_to_baseline(results, baseline['results'],
+                args.tolerance, compare_memory):
+                sys.exit(1)
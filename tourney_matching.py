@@ -0,0 +1,580 @@
+"""
+Maximum-weight matching backends for MatchingPairedTournament.
+
+A matching backend takes the pairing weights of a round as an n-by-n
+weight array and an n-by-n boolean feasibility array (both indexed by
+player index, as returned by MatchingPairedTournament.weight_matrix) and
+returns a maximum-cardinality, maximum-weight matching as an array mate
+such that mate[i] is the index of the player matched with player i, or -1
+if player i is unmatched.
+"""
+from __future__ import division
+import numpy
+import networkx as nx
+
+class MatchingBackend(object):
+    """Abstract base class for a maximum-weight matching backend.
+    
+    The optional changed argument of match is an n-by-n boolean array
+    marking the pairs whose weight or feasibility may have changed since the
+    previous call, or None if this is not known.  Backends may use it to
+    update state kept from the previous call instead of starting afresh.
+    """
+    def match(self, weights, feasible, changed=None):
+        raise NotImplementedError
+
+"""
+Matching backend that solves the matching with networkx.
+
+A networkx graph with one node per player and one edge per feasible pair
+is built and networkx.max_weight_matching is run on it.  If incremental is
+True, the graph is kept between calls and only the changed edges are
+updated when the changed pairs are known.
+"""
+class NetworkxMatchingBackend(MatchingBackend):
+    def __init__(self, incremental=False):
+        self._incremental = incremental
+        self._graph = None
+    
+    def match(self, weights, feasible, changed=None):
+        n = len(weights)
+        graph = self._graph
+        if graph is None or changed is None or graph.number_of_nodes() != n:
+            rows, columns = numpy.nonzero(numpy.triu(feasible, 1))
+            graph = nx.Graph()
+            graph.add_nodes_from(range(n))
+            graph.add_weighted_edges_from(zip(rows.tolist(),
+                columns.tolist(), weights[rows, columns].tolist()))
+        else:
+            rows, columns = numpy.nonzero(numpy.triu(changed, 1))
+            for i, j in zip(rows.tolist(), columns.tolist()):
+                if feasible[i, j]:
+                    graph.add_edge(i, j, weight=weights[i, j].item())
+                elif graph.has_edge(i, j):
+                    graph.remove_edge(i, j)
+        if self._incremental:
+            self._graph = graph
+        matching = nx.max_weight_matching(graph, maxcardinality=True)
+        mate = numpy.empty(n, dtype=int)
+        mate.fill(-1)
+        # networkx 1.x returns a dict of mates, later versions a set of edges
+        if isinstance(matching, dict):
+            for v, w in matching.items():
+                mate[v] = w
+        else:
+            for v, w in matching:
+                mate[v] = w
+                mate[w] = v
+        return mate
+
+"""
+Matching backend that solves the matching directly on the weight array.
+
+This backend runs dense_max_weight_matching, a blossom algorithm that
+works on the weight and feasibility arrays without building a graph.  If
+warm_start is True, the dual variables and the matching of each solution
+are kept and offered as the starting point of the next one: the matched
+pairs that are still tight for the duals, made feasible for the new
+weights, are kept, so that only the players whose weights changed enough
+are matched afresh.
+"""
+class DenseMatchingBackend(MatchingBackend):
+    def __init__(self, warm_start=False):
+        self._warm_start = warm_start
+        self._duals = None
+        self._mate = None
+    
+    def match(self, weights, feasible, changed=None):
+        mate, duals = dense_max_weight_matching(weights, feasible,
+            self._duals, self._mate)
+        if self._warm_start:
+            self._duals = duals
+            self._mate = mate
+        return mate
+
+def dense_max_weight_matching(weights, feasible, vertex_duals=None,
+    initial_mate=None):
+    """Computes a maximum-cardinality, maximum-weight matching.
+
+    weights and feasible are symmetric n-by-n arrays; only the pairs (i, j)
+    with feasible[i, j] True may be matched.  Returns a tuple (mate, duals)
+    where mate[i] is the vertex matched with vertex i (or -1) and duals are
+    the final vertex dual variables.  The dual of each blossom is folded
+    into those of its vertices, so that the vertex duals are feasible on
+    their own; they may be passed back in as vertex_duals, and mate as
+    initial_mate, to warm-start the matching of similar weights.
+
+    This is Edmonds' blossom algorithm, following the primal-dual
+    formulation of Z. Galil, "Efficient Algorithms for Finding Maximum
+    Matching in Graphs", ACM Computing Surveys 18:23-38 (1986) and the
+    implementation by J. van Rantwijk on which networkx's
+    max_weight_matching is also based.  Edges are not stored explicitly:
+    an endpoint of the edge between vertices x and y is encoded as the
+    integer x * n + y (the endpoint at y as seen from x), and the scans over
+    the neighbours of a vertex are done with array operations on rows of
+    the weight array.  The dual variables are scaled by two, so that the
+    slack of edge (i, j) is duals[i] + duals[j] - 2 * weights[i, j].
+
+    The algorithm starts from feasible duals in which every vertex has a
+    tight edge, derived from the largest weight at each vertex or, if they
+    give a smaller dual objective, from vertex_duals.  In that case it
+    keeps the pairs of initial_mate whose edges are still tight, and it
+    completes the starting matching greedily with other tight edges.  Any
+    feasible starting duals and tight starting matching lead to
+    an optimal perfect matching when one exists.  Otherwise, the matching is
+    recomputed from equal starting duals for all vertices, which guarantees
+    maximum weight among the matchings of maximum cardinality.
+    """
+    w2 = 2 * numpy.asarray(weights, dtype=float)
+    n = w2.shape[0]
+    feas = numpy.array(feasible, dtype=bool)
+    numpy.fill_diagonal(feas, False)
+    if n == 0 or not feas.any():
+        return numpy.zeros(n, dtype=int) - 1, numpy.zeros(n)
+    masked = numpy.where(feas, w2, -numpy.inf)
+    start = masked.max(axis=1) / 2
+    start[numpy.isinf(start)] = 0
+    start = _tightened_duals(start, masked)
+    if vertex_duals is not None and len(vertex_duals) == n:
+        warm_start = _tightened_duals(vertex_duals, masked)
+        if warm_start.sum() < start.sum():
+            start = warm_start
+        else:
+            initial_mate = None
+    else:
+        initial_mate = None
+    mate, duals = _blossom_matching(w2, feas, start, initial_mate)
+    if (mate < 0).any():
+        mate, duals = _blossom_matching(w2, feas,
+            numpy.zeros(n) + max(0.0, w2[feas].max() / 2))
+    return mate, duals
+
+def _tightened_duals(vertex_duals, masked):
+    # Raises the duals where needed to make them feasible for the (doubled)
+    # weights in masked, where infeasible pairs are -inf, and then lowers
+    # each in turn as far as feasibility allows.
+    slack = numpy.add.outer(vertex_duals, vertex_duals) - masked
+    duals = vertex_duals + numpy.maximum(0, -slack.min(axis=1))
+    for i in range(len(duals)):
+        lowest = (masked[i] - duals).max()
+        if lowest > -numpy.inf:
+            duals[i] = lowest
+    return duals
+
+def _blossom_matching(w2, feas, vertex_duals, initial_mate=None):
+    n = len(vertex_duals)
+    # dual[0:n] are the vertex duals, dual[n:2n] the blossom duals
+    dual = numpy.zeros(2 * n)
+    dual[:n] = vertex_duals
+
+    # top-level blossom (or vertex) containing each vertex
+    inblossom = numpy.arange(n)
+    # per blossom (or vertex): parent blossom, children and the endpoints
+    # joining consecutive children, base vertex
+    blossomparent = numpy.zeros(2 * n, dtype=int) - 1
+    blossomchilds = [None] * (2 * n)
+    blossomendps = [None] * (2 * n)
+    blossombase = numpy.concatenate((numpy.arange(n),
+        numpy.zeros(n, dtype=int) - 1))
+    unusedblossoms = list(range(n, 2 * n))
+    # for each non-trivial S-blossom, the least-slack edges to each
+    # neighbouring S-blossom
+    blossombestedges = [None] * (2 * n)
+    # 0 = free, 1 = S, 2 = T; 5 is used temporarily by scan_blossom
+    label = numpy.zeros(2 * n, dtype=int)
+    # endpoint through which the blossom (or vertex) obtained its label
+    labelend = [-1] * (2 * n)
+    # least-slack edge to a different S-blossom
+    bestedge = numpy.zeros(2 * n, dtype=int) - 1
+    # endpoint of the matched edge at the mate of each vertex
+    mate = [-1] * n
+    allowedge = numpy.zeros((n, n), dtype=bool)
+    queue = []
+
+    def endpoint(p):
+        return p % n
+
+    def flip(p):
+        return (p % n) * n + p // n
+
+    def slack_of(p):
+        i, j = divmod(p, n)
+        return dual[i] + dual[j] - w2[i, j]
+
+    def slacks_of(p):
+        i, j = numpy.divmod(p, n)
+        return dual[i] + dual[j] - w2[i, j]
+
+    def leaves(b):
+        if b < n:
+            return [b]
+        result = []
+        stack = [b]
+        while stack:
+            t = stack.pop()
+            if t < n:
+                result.append(t)
+            else:
+                stack.extend(blossomchilds[t])
+        return result
+
+    def assign_label(w, t, p):
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(leaves(b))
+        else:
+            base = blossombase[b]
+            assign_label(endpoint(mate[base]), 1, flip(mate[base]))
+
+    def scan_blossom(v, w):
+        # Trace back from v and w to find a new blossom (returning its base)
+        # or an augmenting path (returning -1).
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
+            else:
+                v = endpoint(labelend[b])
+                b = inblossom[v]
+                v = endpoint(labelend[b])
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def add_blossom(base, v, w):
+        # endpoint at v of the edge (v, w) that closes the blossom
+        edge_endpoint = w * n + v
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint(labelend[bv])
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(edge_endpoint)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(flip(labelend[bw]))
+            w = endpoint(labelend[bw])
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dual[b] = 0
+        blossom_leaves = leaves(b)
+        for u in blossom_leaves:
+            if label[inblossom[u]] == 2:
+                queue.append(u)
+        inblossom[blossom_leaves] = b
+        # compute the least-slack edges to the neighbouring S-blossoms
+        s_blossom = label[inblossom] == 1
+        candidates = []
+        for bv in path:
+            if blossombestedges[bv] is None:
+                rows = numpy.array(leaves(bv))
+                mask = feas[rows] & s_blossom & (inblossom != b)
+                i, j = numpy.nonzero(mask)
+                candidates.append(rows[i] * n + j)
+            else:
+                i, j = numpy.divmod(blossombestedges[bv], n)
+                outside = inblossom[j] == b
+                i, j = numpy.where(outside, j, i), numpy.where(outside, i, j)
+                keep = (inblossom[j] != b) & s_blossom[j]
+                candidates.append(i[keep] * n + j[keep])
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        candidates = numpy.concatenate(candidates)
+        if len(candidates) == 0:
+            blossombestedges[b] = candidates
+            bestedge[b] = -1
+            return
+        candidate_slacks = slacks_of(candidates)
+        neighbours = inblossom[candidates % n]
+        order = numpy.lexsort((candidate_slacks, neighbours))
+        first = numpy.unique(neighbours[order], return_index=True)[1]
+        best = order[first]
+        blossombestedges[b] = candidates[best]
+        bestedge[b] = candidates[best[numpy.argmin(candidate_slacks[best])]]
+
+    def expand_blossom(b, endstage):
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < n:
+                inblossom[s] = s
+            elif endstage and dual[s] == 0:
+                expand_blossom(s, endstage)
+            else:
+                inblossom[leaves(s)] = s
+        if (not endstage) and label[b] == 2:
+            # Relabel the children on the even-length path from the entry
+            # child to the base as T and S alternately.
+            entrychild = inblossom[endpoint(flip(labelend[b]))]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+            p = labelend[b]
+            while j != 0:
+                q = blossomendps[b][j - endptrick]
+                label[endpoint(flip(p))] = 0
+                label[endpoint(q if endptrick else flip(q))] = 0
+                assign_label(endpoint(flip(p)), 2, p)
+                i, k = divmod(q, n)
+                allowedge[i, k] = allowedge[k, i] = True
+                j += jstep
+                q = blossomendps[b][j - endptrick]
+                p = flip(q) if endptrick else q
+                i, k = divmod(p, n)
+                allowedge[i, k] = allowedge[k, i] = True
+                j += jstep
+            bv = blossomchilds[b][j]
+            label[endpoint(flip(p))] = label[bv] = 2
+            labelend[endpoint(flip(p))] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in leaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint(mate[blossombase[bv]])] = 0
+                    assign_label(v, 2, labelend[v])
+                j += jstep
+        label[b] = 0
+        labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augment_blossom(b, v):
+        # Swap matched and unmatched edges on the path from v to the base
+        # of blossom b, making v the new base.
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= n:
+            augment_blossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            q = blossomendps[b][j - endptrick]
+            p = flip(q) if endptrick else q
+            if t >= n:
+                augment_blossom(t, endpoint(p))
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= n:
+                augment_blossom(t, endpoint(flip(p)))
+            mate[endpoint(p)] = flip(p)
+            mate[endpoint(flip(p))] = p
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augment_matching(v, w):
+        for s, p in ((v, v * n + w), (w, w * n + v)):
+            while True:
+                bs = inblossom[s]
+                if bs >= n:
+                    augment_blossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint(labelend[bs])
+                bt = inblossom[t]
+                s = endpoint(labelend[bt])
+                j = endpoint(flip(labelend[bt]))
+                if bt >= n:
+                    augment_blossom(bt, j)
+                mate[j] = labelend[bt]
+                p = flip(labelend[bt])
+
+    def scan(v):
+        # Scans the edges of S-vertex v; returns True after augmenting.
+        bv = inblossom[v]
+        row_slack = dual[v] + dual[:n] - w2[v]
+        candidates = feas[v] & (inblossom != bv)
+        allowed = candidates & (allowedge[v] | (row_slack <= 0))
+        allowedge[v, allowed] = True
+        allowedge[allowed, v] = True
+        for w in numpy.flatnonzero(allowed).tolist():
+            bw = inblossom[w]
+            if bw == inblossom[v]:
+                continue
+            if label[bw] == 0:
+                assign_label(w, 2, w * n + v)
+            elif label[bw] == 1:
+                base = scan_blossom(v, w)
+                if base >= 0:
+                    add_blossom(base, v, w)
+                else:
+                    augment_matching(v, w)
+                    return True
+            elif label[w] == 0:
+                label[w] = 2
+                labelend[w] = w * n + v
+        # Record the least-slack edges that are not yet tight.
+        bv = inblossom[v]
+        rest = candidates & ~allowed & (inblossom != bv)
+        top_label = label[inblossom]
+        to_s = numpy.flatnonzero(rest & (top_label == 1))
+        if len(to_s) > 0:
+            w = to_s[numpy.argmin(row_slack[to_s])]
+            if bestedge[bv] == -1 or row_slack[w] < slack_of(bestedge[bv]):
+                bestedge[bv] = v * n + w
+        to_free = numpy.flatnonzero(rest & (top_label != 1) &
+            (label[:n] == 0))
+        if len(to_free) > 0:
+            current = bestedge[to_free]
+            current_slack = numpy.where(current >= 0,
+                slacks_of(numpy.maximum(current, 0)), numpy.inf)
+            better = to_free[row_slack[to_free] < current_slack]
+            bestedge[better] = v * n + better
+        return False
+
+    # Start from the edges of the initial matching that are still tight,
+    # completed greedily with other tight edges.
+    tight = feas & (dual[:n, numpy.newaxis] + dual[numpy.newaxis, :n] -
+        w2 <= 0)
+    free = numpy.ones(n, dtype=bool)
+    if initial_mate is not None:
+        for v, w in enumerate(initial_mate):
+            if w > v and tight[v, w]:
+                free[v] = free[w] = False
+                mate[v] = v * n + w
+                mate[w] = w * n + v
+    for v in range(n):
+        if free[v]:
+            partners = numpy.flatnonzero(tight[v] & free)
+            if len(partners) > 0:
+                w = partners[0]
+                free[v] = free[w] = False
+                mate[v] = v * n + w
+                mate[w] = w * n + v
+
+    while True:
+        # Each stage grows alternating trees from all free vertices until
+        # an augmenting path is found.
+        label[:] = 0
+        bestedge[:] = -1
+        blossombestedges[n:] = [None] * n
+        allowedge[:] = False
+        del queue[:]
+        for v in range(n):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assign_label(v, 1, -1)
+        augmented = False
+        while True:
+            while queue and not augmented:
+                augmented = scan(queue.pop())
+            if augmented:
+                break
+            # No tight edge remains to be scanned: adjust the duals.
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+            top_label = label[inblossom]
+            mask = (top_label == 0) & (bestedge[:n] >= 0)
+            if mask.any():
+                edges = bestedge[:n][mask]
+                edge_slacks = slacks_of(edges)
+                k = numpy.argmin(edge_slacks)
+                delta = edge_slacks[k]
+                deltatype = 2
+                deltaedge = edges[k]
+            mask = (blossomparent == -1) & (label == 1) & (bestedge >= 0)
+            if mask.any():
+                edges = bestedge[mask]
+                edge_slacks = slacks_of(edges) / 2
+                k = numpy.argmin(edge_slacks)
+                if deltatype == -1 or edge_slacks[k] < delta:
+                    delta = edge_slacks[k]
+                    deltatype = 3
+                    deltaedge = edges[k]
+            top_blossoms = (blossombase >= 0) & (blossomparent == -1)
+            top_blossoms[:n] = False
+            mask = top_blossoms & (label == 2)
+            if mask.any():
+                blossoms = numpy.flatnonzero(mask)
+                k = numpy.argmin(dual[blossoms])
+                if deltatype == -1 or dual[blossoms[k]] < delta:
+                    delta = dual[blossoms[k]]
+                    deltatype = 4
+                    deltablossom = blossoms[k]
+            if deltatype == -1:
+                # No augmenting path exists: the matching has maximum
+                # cardinality.
+                deltatype = 1
+                delta = max(0, dual[:n].min())
+            dual[:n] -= delta * (top_label == 1)
+            dual[:n] += delta * (top_label == 2)
+            dual[n:] += delta * (top_blossoms & (label == 1))[n:]
+            dual[n:] -= delta * (top_blossoms & (label == 2))[n:]
+            if deltatype == 1:
+                break
+            elif deltatype == 2 or deltatype == 3:
+                i, j = divmod(int(deltaedge), n)
+                allowedge[i, j] = allowedge[j, i] = True
+                if label[inblossom[i]] != 1:
+                    i, j = j, i
+                queue.append(i)
+            else:
+                expand_blossom(deltablossom, False)
+        if not augmented:
+            break
+        # Expand the S-blossoms whose dual has dropped to zero.
+        for b in range(n, 2 * n):
+            if (blossomparent[b] == -1 and blossombase[b] >= 0 and
+                label[b] == 1 and dual[b] == 0):
+                expand_blossom(b, True)
+
+    # Fold the dual of each blossom into those of its vertices, so that the
+    # vertex duals alone are feasible and keep every edge inside a blossom
+    # tight.
+    vertex_duals = dual[:n].copy()
+    for b in range(n, 2 * n):
+        if blossombase[b] >= 0 and dual[b] != 0:
+            vertex_duals[leaves(b)] += dual[b]
+    result = numpy.array([-1 if p == -1 else endpoint(p) for p in mate])
+    return result, vertex_duals
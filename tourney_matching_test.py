@@ -0,0 +1,188 @@
+"""
+Cross-checks of the dense blossom matching against networkx.
+
+Each check solves random matching problems, and the weights of rounds of
+simulated tournaments, with DenseMatchingBackend and with networkx and
+asserts that both find matchings of the same cardinality and weight (the
+matchings themselves may differ when there are ties).  The weights kept
+between rounds in incremental mode are checked against weights computed
+from scratch.  The checks are named test_* so that pytest can run them;
+run as a script, this runs them all with the seed given on the command
+line, or a random one.
+"""
+from __future__ import division
+import argparse
+import random
+import numpy
+import networkx as nx
+import tourney
+import tourney_matching
+import tourney_sim
+import tourney_test
+
+def _random_instance(rng, n):
+    # Integer weights with many ties or real weights, on a complete graph
+    # or a sparse one that often has no perfect matching.
+    if rng.randint(2):
+        weights = rng.randint(-5, 6, size=(n, n)).astype(float)
+    else:
+        weights = rng.normal(size=(n, n))
+    weights = numpy.triu(weights, 1)
+    weights = weights + weights.T
+    density = 1.0 if rng.randint(2) else rng.uniform(0.1, 0.6)
+    feasible = numpy.triu(rng.uniform(size=(n, n)) < density, 1)
+    feasible = feasible | feasible.T
+    return weights, feasible
+
+"""Returns the cardinality and weight of a matching found by networkx."""
+def networkx_optimum(weights, feasible):
+    rows, columns = numpy.nonzero(numpy.triu(feasible, 1))
+    graph = nx.Graph()
+    graph.add_nodes_from(range(len(weights)))
+    graph.add_weighted_edges_from(zip(rows.tolist(), columns.tolist(),
+        weights[rows, columns].tolist()))
+    matching = nx.max_weight_matching(graph, maxcardinality=True)
+    if isinstance(matching, dict):
+        matching = [(v, w) for v, w in matching.items() if v < w]
+    return len(matching), sum(weights[v, w] for v, w in matching)
+
+"""Asserts that mate is a valid matching on the feasible pairs with the
+cardinality and (up to rounding) the weight of the networkx matching."""
+def check_matching(mate, weights, feasible):
+    n = len(weights)
+    cardinality = 0
+    total = 0.0
+    for i in range(n):
+        j = mate[i]
+        if j < 0:
+            continue
+        assert mate[j] == i, "mate is not symmetric"
+        assert feasible[i, j], "infeasible pair {0}, {1}".format(i, j)
+        if j > i:
+            cardinality += 1
+            total += weights[i, j]
+    expected_cardinality, expected_total = networkx_optimum(weights,
+        feasible)
+    assert cardinality == expected_cardinality, (
+        "cardinality {0}, networkx {1}".format(cardinality,
+        expected_cardinality))
+    assert abs(total - expected_total) <= 1e-9 * max(1.0,
+        abs(expected_total)), "weight {0!r}, networkx {1!r}".format(total,
+        expected_total)
+
+"""Solves random problems from scratch, checking also that the vertex duals
+returned, which warm starts rely on, are feasible on their own."""
+def test_dense_matching(seed=0, instances=200):
+    rng = numpy.random.RandomState(seed)
+    for k in range(instances):
+        weights, feasible = _random_instance(rng, rng.randint(1, 25))
+        mate, duals = tourney_matching.dense_max_weight_matching(weights,
+            feasible)
+        check_matching(mate, weights, feasible)
+        slacks = numpy.add.outer(duals, duals) - 2 * weights
+        assert not (slacks[feasible] < -1e-9).any(), "infeasible duals"
+
+"""Solves sequences of random problems in which a few rows and columns of
+the weights change at a time, as between rounds of a tournament, with a
+warm-started backend."""
+def test_warm_start(seed=0, sequences=20, steps=15):
+    rng = numpy.random.RandomState(seed)
+    for k in range(sequences):
+        n = rng.randint(2, 25)
+        weights, feasible = _random_instance(rng, n)
+        backend = tourney_matching.DenseMatchingBackend(warm_start=True)
+        for step in range(steps):
+            check_matching(backend.match(weights, feasible), weights,
+                feasible)
+            new_weights, new_feasible = _random_instance(rng, n)
+            changed = rng.uniform(size=n) < 0.3
+            changed = numpy.logical_or.outer(changed, changed)
+            weights = numpy.where(changed, new_weights, weights)
+            feasible = numpy.where(changed, new_feasible, feasible)
+
+"""Returns the mate array of the pairing of the tournament t."""
+def pairing_mate(t, pairing):
+    index = {p: i for i, p in enumerate(t.players_view)}
+    mate = numpy.empty(len(index), dtype=int)
+    mate.fill(-1)
+    for x, y in (tuple(pair) for pair in pairing):
+        mate[index[x]] = index[y]
+        mate[index[y]] = index[x]
+    return mate
+
+"""Plays matching tournaments in incremental mode, whose default backend is
+warm-started, and with a warm-started backend and the Bradley-Terry
+weights, checking the matching of every round."""
+def test_warm_start_tournaments(seed=0, num_players=16, num_rounds=10):
+    rng = numpy.random.RandomState(seed)
+    for wf, bwf, backend, incremental in (
+        (tourney_test.weight_function2, None, None, True),
+        (tourney_test.weight_function4, tourney_test.batch_weight_function4,
+        None, True),
+        (tourney_test.weight_function4, tourney_test.batch_weight_function4,
+        tourney_matching.DenseMatchingBackend(warm_start=True), False)):
+        t = tourney.MatchingPairedTournament(
+            tourney_sim.get_players(num_players, rng), wf, bwf, backend,
+            incremental, local_weights=bwf is None)
+        for r in range(num_rounds):
+            weights, feasible = t.weight_matrix()
+            pairing = t.next_pairing()
+            check_matching(pairing_mate(t, pairing), weights, feasible)
+            t.push_results(tourney_sim.simulate_round(pairing, rng))
+
+"""Plays tournaments in incremental mode with an incremental networkx
+backend, calling weight_matrix between the rounds, and checks after every
+pairing that the graph of the backend has the weights of weight_matrix,
+which recomputes them all, and that the matching is optimal for them."""
+def test_incremental_weight_matrix(seed=0, num_players=16, num_rounds=6):
+    rng = numpy.random.RandomState(seed)
+    # With weight_function, the pairs that have met become infeasible; the
+    # Bradley-Terry weights change for pairs whose games have not changed.
+    for wf, bwf in ((tourney_test.weight_function, None),
+        (tourney_test.weight_function2, None),
+        (tourney_test.weight_function4, tourney_test.batch_weight_function4)):
+        backend = tourney_matching.NetworkxMatchingBackend(incremental=True)
+        t = tourney.MatchingPairedTournament(
+            tourney_sim.get_players(num_players, rng), wf, bwf, backend,
+            True, local_weights=bwf is None)
+        for r in range(num_rounds):
+            t.weight_matrix()
+            pairing = t.next_pairing()
+            weights, feasible = t.weight_matrix()
+            rows, columns = numpy.nonzero(numpy.triu(feasible, 1))
+            expected = {(i, j): weights[i, j] for i, j in zip(rows.tolist(),
+                columns.tolist())}
+            edges = {(min(i, j), max(i, j)): data['weight']
+                for i, j, data in backend._graph.edges(data=True)}
+            assert edges == expected, "stale weights in round {0}".format(
+                r + 1)
+            check_matching(pairing_mate(t, pairing), weights, feasible)
+            t.push_results(tourney_sim.simulate_round(pairing, rng))
+
+"""Checks that incremental mode is refused when the changed pairs cannot be
+found."""
+def test_incremental_needs_changed_pairs(seed=0):
+    players = tourney_sim.get_players(4, numpy.random.RandomState(seed))
+    try:
+        tourney.MatchingPairedTournament(players,
+            tourney_test.weight_function4, incremental=True)
+    except ValueError:
+        return
+    raise AssertionError("incremental mode accepted without a way to find "
+        "the changed pairs")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Check the dense matching backend against networkx')
+    parser.add_argument('--seed', type=int, dest='seed', default=None,
+        help='the random seed')
+    args = parser.parse_args()
+    seed = args.seed
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    print('Seed {0}'.format(seed))
+    for check in (test_dense_matching, test_warm_start,
+        test_warm_start_tournaments, test_incremental_weight_matrix,
+        test_incremental_needs_changed_pairs):
+        check(seed)
+        print('{0}: passed'.format(check.__name__))
@@ -0,0 +1,156 @@
+"""
+Vectorized statistics of tournaments.
+
+Each statistic of tourney_sim.test_harness is computed from arrays indexed
+by player index: the symmetric array of the number of games played between
+each pair of players, the abilities of the players and the values of the
+final ranking.  Leading dimensions of the arrays index a batch of
+tournaments, for which the statistics are computed at once.
+"""
+from __future__ import division
+import numpy
+import scipy.special
+
+STATISTICS = ('rank_coefficient', 'closeness_value', 'match_information',
+    'win_share')
+
+"""Returns the ranks of the values along the last axis of an array.
+
+Tied values share the mean of their ranks, and every rank is offset by one
+half: the values are sorted, and a value preceded by k smaller values and
+equal to c values (itself included) has rank k + 1 + c / 2.  The ranks are
+found by sorting, in O(n log n) time.
+"""
+def rank_array(values):
+    values = numpy.asarray(values)
+    n = values.shape[-1]
+    order = numpy.argsort(values, axis=-1, kind='mergesort')
+    sorted_values = numpy.take_along_axis(values, order, axis=-1)
+    positions = numpy.arange(n)
+    # the first position of each run of equal values, and the first
+    # position after it
+    first = numpy.ones(values.shape, dtype=bool)
+    first[..., 1:] = sorted_values[..., 1:] != sorted_values[..., :-1]
+    last = numpy.ones(values.shape, dtype=bool)
+    last[..., :-1] = first[..., 1:]
+    starts = numpy.maximum.accumulate(numpy.where(first, positions, 0),
+        axis=-1)
+    ends = numpy.minimum.accumulate(numpy.where(last, positions + 1,
+        n)[..., ::-1], axis=-1)[..., ::-1]
+    ranks = numpy.empty(values.shape)
+    numpy.put_along_axis(ranks, order, starts + 1 + (ends - starts) / 2.0,
+        axis=-1)
+    return ranks
+
+"""Returns the Spearman coefficients of pairs of rank arrays along the last
+axis, as for a pair of rank lists.
+
+The sums are accumulated in order along the last axis, rather than
+pairwise as numpy.sum does, so that the result is the same to the last bit
+as summing the elements one by one.
+"""
+def spearman_array(first_ranks, second_ranks):
+    mean = (first_ranks.shape[-1] + 1) / 2.0
+    normed_first_ranks = first_ranks - mean
+    normed_second_ranks = second_ranks - mean
+    numerator = _sequential_sum(normed_first_ranks * normed_second_ranks)
+    denominator = (_sequential_sum(normed_first_ranks**2) *
+        _sequential_sum(normed_second_ranks**2))**0.5
+    return numerator / denominator
+
+def _sequential_sum(values):
+    return numpy.cumsum(values, axis=-1)[..., -1]
+
+"""Returns the Spearman rank coefficients between abilities and rankings.
+
+abilities and rankings are arrays with one row per tournament (or single
+rows), giving the ability and the ranking value of each player.  As in
+compute_spearman_rank_coefficient, the players are taken in decreasing
+order of ranking value, so that the results are the same.
+"""
+def spearman_rank_coefficients(abilities, rankings):
+    abilities = numpy.asarray(abilities, dtype=float)
+    rankings = numpy.asarray(rankings, dtype=float)
+    order = numpy.argsort(-rankings, axis=-1, kind='mergesort')
+    return spearman_array(
+        rank_array(numpy.take_along_axis(abilities, order, axis=-1)),
+        rank_array(numpy.take_along_axis(rankings, order, axis=-1)))
+
+"""Returns Kendall's tau-b between pairs of arrays of values along the last
+axis.
+
+Pairs tied in either array count as neither concordant nor discordant, and
+the coefficient is normalized by the numbers of pairs untied in each array.
+All pairs are compared at once, so this takes O(n^2) time and memory per
+row.
+"""
+def kendall_tau_array(first_values, second_values):
+    first_values = numpy.asarray(first_values, dtype=float)
+    second_values = numpy.asarray(second_values, dtype=float)
+    first_signs = numpy.sign(first_values[..., :, numpy.newaxis] -
+        first_values[..., numpy.newaxis, :])
+    second_signs = numpy.sign(second_values[..., :, numpy.newaxis] -
+        second_values[..., numpy.newaxis, :])
+    # each pair is counted twice
+    concordance = (first_signs * second_signs).sum(axis=(-2, -1)) / 2.0
+    first_untied = (first_signs != 0).sum(axis=(-2, -1)) / 2.0
+    second_untied = (second_signs != 0).sum(axis=(-2, -1)) / 2.0
+    return concordance / (first_untied * second_untied)**0.5
+
+"""Returns the sums over pairs of players of the number of games they
+played times the square of their difference in ability."""
+def closeness_values(games, abilities):
+    abilities = numpy.asarray(abilities, dtype=float)
+    differences = (abilities[..., :, numpy.newaxis] -
+        abilities[..., numpy.newaxis, :])
+    return 0.5 * (games * differences**2).sum(axis=(-2, -1))
+
+"""Returns the sums over pairs of players of the number of games they
+played times p(1-p), where p is the probability that one beats the other
+(see Glickman and Jensen 2005)."""
+def match_informations(games, abilities):
+    abilities = numpy.asarray(abilities, dtype=float)
+    p = scipy.special.ndtr(abilities[..., :, numpy.newaxis] -
+        abilities[..., numpy.newaxis, :])
+    return 0.5 * (games * p * (1-p)).sum(axis=(-2, -1))
+
+"""Returns 1/n if the player of highest ability finishes tied for first
+with n players, and 0 otherwise."""
+def win_shares(abilities, rankings):
+    abilities = numpy.asarray(abilities, dtype=float)
+    rankings = numpy.asarray(rankings, dtype=float)
+    best_player = abilities.argmax(axis=-1)[..., numpy.newaxis]
+    highest_ranked = rankings == rankings.max(axis=-1)[..., numpy.newaxis]
+    return numpy.where(
+        numpy.take_along_axis(highest_ranked, best_player, axis=-1)[..., 0],
+        1.0 / highest_ranked.sum(axis=-1), 0.0)
+
+"""Returns a dict mapping each of the given statistics (by default, all
+of the statistics of test_harness) to its value, or array of values for a
+batch of tournaments.  Only the statistics asked for are computed."""
+def statistics(games, abilities, rankings, names=STATISTICS):
+    functions = {
+        'rank_coefficient': lambda: spearman_rank_coefficients(abilities,
+            rankings),
+        'closeness_value': lambda: closeness_values(games, abilities),
+        'match_information': lambda: match_informations(games, abilities),
+        'win_share': lambda: win_shares(abilities, rankings)}
+    for name in names:
+        if name not in functions:
+            raise ValueError("Unknown statistic {0!r}".format(name))
+    return {name: functions[name]() for name in names}
+
+"""Returns the arrays of games played, abilities and ranking values of a
+tournament whose players have abilities."""
+def tournament_arrays(t):
+    ranking = t.ranking()
+    players = t.players_view
+    return (t.games_array, numpy.array([p.ability for p in players]),
+        numpy.array([ranking[p] for p in players], dtype=float))
+
+"""Returns the given statistics of a tournament whose players have
+abilities, as Python floats."""
+def tournament_statistics(t, names=STATISTICS):
+    games, abilities, rankings = tournament_arrays(t)
+    return {name: float(value) for name, value in
+        statistics(games, abilities, rankings, names).items()}
@@ -0,0 +1,161 @@
+"""
+Timing of the stages of tournaments.
+
+A TournamentProfiler attached to a tournament replaces the methods of that
+one tournament object (not of its class) with wrappers that time them, so
+tournaments without a profiler run exactly as before.  A profiler may be
+attached to any number of tournaments, e.g. to each trial of a test, and
+accumulates the times of all of them.
+"""
+from __future__ import division
+import time
+import tourney
+
+try:
+    _timer = time.perf_counter
+except AttributeError:
+    _timer = time.time
+
+"""
+Profiler of the stages of PairedTournaments, by round.
+
+The sections timed are:
+* 'next_pairing': next_pairing, including the sections below that it uses
+* 'weights': the computation of the weights of a MatchingPairedTournament
+  (by its weight function or batch weight function)
+* 'matching': the matching backend of a MatchingPairedTournament
+* 'push_results': push_results
+* 'bradley_terry': solving for the modified Bradley-Terry ratings, which
+  happens at most once per round, when they are first needed; the number
+  of iterations of each solve is recorded too
+
+Sections nest, so their times overlap rather than add up.
+"""
+class TournamentProfiler(object):
+    SECTIONS = ('next_pairing', 'weights', 'matching', 'push_results',
+        'bradley_terry')
+    
+    def __init__(self):
+        # for each section, a dict of round number to [calls, seconds]
+        self._times = {s: {} for s in self.SECTIONS}
+        self._iterations = {}
+        self._tournaments = 0
+    
+    def attach(self, t):
+        """Instruments the tournament t.  Attaching the same profiler again
+        does nothing; attaching a second profiler is an error."""
+        if t._profiler is self:
+            return
+        elif t._profiler is not None:
+            raise ValueError("Tournament already has a profiler")
+        t._profiler = self
+        self._tournaments += 1
+        self._wrap(t, 'next_pairing', 'next_pairing')
+        self._wrap(t, 'push_results', 'push_results')
+        self._wrap_bradley_terry(t)
+        if isinstance(t, tourney.MatchingPairedTournament):
+            self._wrap(t, '_updated_weight_matrix', 'weights')
+            t._matching_backend = _ProfiledBackend(t._matching_backend,
+                self, t)
+    
+    def _wrap(self, t, name, section):
+        method = getattr(t, name)
+        def wrapper(*args, **kwargs):
+            round_number = t.rounds_complete
+            start = _timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(section, round_number, _timer() - start)
+        setattr(t, name, wrapper)
+    
+    def _wrap_bradley_terry(self, t):
+        method = t.modified_bradley_terry_rating_array
+        def wrapper():
+            if not t._is_modified_bradley_terry_dirty:
+                return method()
+            round_number = t.rounds_complete
+            start = _timer()
+            ratings = method()
+            self.add('bradley_terry', round_number, _timer() - start)
+            self._iterations.setdefault(round_number, []).append(
+                t._modified_bradley_terry_iterations)
+            return ratings
+        t.modified_bradley_terry_rating_array = wrapper
+    
+    def add(self, section, round_number, seconds, calls=1):
+        entry = self._times[section].setdefault(round_number, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+    
+    def merge(self, other):
+        """Adds the times and iterations recorded by another profiler to
+        this one's."""
+        for section in self.SECTIONS:
+            for round_number, (calls, seconds) in (
+                other._times[section].items()):
+                self.add(section, round_number, seconds, calls)
+        for round_number, iterations in other._iterations.items():
+            self._iterations.setdefault(round_number, []).extend(iterations)
+        self._tournaments += other._tournaments
+    
+    @property
+    def tournaments(self):
+        return self._tournaments
+    
+    def round_times(self, section):
+        """Returns a dict mapping each round number (the number of rounds
+        complete when the section ran) to (calls, seconds) for the
+        section."""
+        return {r: tuple(entry) for r, entry in self._times[section].items()}
+    
+    def totals(self):
+        """Returns a dict mapping each section to (calls, seconds) over all
+        rounds."""
+        totals = {}
+        for section in self.SECTIONS:
+            entries = self._times[section].values()
+            totals[section] = (sum(e[0] for e in entries),
+                sum(e[1] for e in entries))
+        return totals
+    
+    def bradley_terry_iterations(self):
+        """Returns a dict mapping each round number to the list of the
+        iteration counts of the Bradley-Terry solves in that round."""
+        return {r: list(i) for r, i in self._iterations.items()}
+    
+    def report(self):
+        """Returns a printable summary of the totals, per tournament."""
+        n = max(self._tournaments, 1)
+        lines = ['   Section      Calls   Total (s)  Per tourney (s)',
+            '------------- -------- ---------- ---------------']
+        totals = self.totals()
+        for section in self.SECTIONS:
+            calls, seconds = totals[section]
+            if calls > 0:
+                lines.append('{0:13s} {1:8d} {2:10.4f} {3:15.6f}'.format(
+                    section, calls, seconds, seconds / n))
+        iterations = [i for r in self._iterations.values() for i in r]
+        if iterations:
+            lines.append('Bradley-Terry iterations per solve: mean '
+                '{0:0.2f}, max {1}'.format(sum(iterations) / len(iterations),
+                max(iterations)))
+        return '\n'.join(lines)
+
+"""Matching backend timing the match calls of another for a profiler."""
+class _ProfiledBackend(object):
+    def __init__(self, backend, profiler, tournament):
+        self._backend = backend
+        self._profiler = profiler
+        self._tournament = tournament
+    
+    def match(self, *args, **kwargs):
+        round_number = self._tournament.rounds_complete
+        start = _timer()
+        try:
+            return self._backend.match(*args, **kwargs)
+        finally:
+            self._profiler.add('matching', round_number, _timer() - start)
+    
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
@@ -0,0 +1,217 @@
+"""
+Columnar storage and summaries of the results of simulated trials.
+
+A result bundle is a directory holding one .npy file per column and a
+meta.json file naming the methods compared and the statistics recorded.
+Each row is one trial of one method, with columns for the trial number,
+the method (as an index into the method names), the number of players,
+the number of rounds, the seed of the run and each of the statistics of
+tourney_sim.test_harness.  The columns are memory-mapped, both while
+being written and when read back, so summarizing millions of trials needs
+neither parsing nor loading everything into memory.
+
+Run as a script, this prints the summary of a bundle.
+"""
+from __future__ import division
+import os
+import json
+import argparse
+import numpy
+import scipy.special
+import tourney_metrics
+
+META_FILE = 'meta.json'
+KEY_COLUMNS = (('trial', numpy.int64), ('method', numpy.int16),
+    ('num_players', numpy.int32), ('num_rounds', numpy.int32),
+    ('seed', numpy.int64))
+DEFAULT_CONFIDENCE = 0.95
+
+"""
+Writes the rows of a result bundle to path, which is created if need be.
+
+The number of rows is fixed when the bundle is created; rows may then be
+written in any order.  Rows never written keep a trial number of -1 and
+are skipped when the bundle is read, so an interrupted run still leaves a
+usable bundle of the trials that were finished.
+"""
+class ResultWriter(object):
+    def __init__(self, path, num_rows, methods,
+        statistics=tourney_metrics.STATISTICS):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._path = path
+        self._methods = tuple(methods)
+        self._statistics = tuple(statistics)
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump({'num_rows': num_rows, 'methods': self._methods,
+                'statistics': self._statistics}, f)
+        self._columns = {}
+        for name, dtype in KEY_COLUMNS + tuple(
+            (s, numpy.float64) for s in self._statistics):
+            self._columns[name] = numpy.lib.format.open_memmap(
+                self._column_path(name), mode='w+', dtype=dtype,
+                shape=(num_rows,))
+        self._columns['trial'][:] = -1
+    
+    def _column_path(self, name):
+        return os.path.join(self._path, name + '.npy')
+    
+    @property
+    def methods(self):
+        return self._methods
+    
+    def write(self, row, trial, method, num_players, num_rounds, seed,
+        values):
+        """Writes a row.  values maps (at least) each statistic of the
+        bundle to its value; method is an index into the method names."""
+        columns = self._columns
+        columns['method'][row] = method
+        columns['num_players'][row] = num_players
+        columns['num_rounds'][row] = num_rounds
+        columns['seed'][row] = -1 if seed is None else seed
+        for s in self._statistics:
+            columns[s][row] = values[s]
+        # the trial is written last, marking the row complete
+        columns['trial'][row] = trial
+    
+    def flush(self):
+        for column in self._columns.values():
+            column.flush()
+    
+    def close(self):
+        self.flush()
+        self._columns = {}
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+"""Returns (meta, columns) for the bundle at path, where meta is the
+contents of its meta.json and columns maps each column name to an array of
+the rows written.  The arrays are memory-mapped unless mmap_mode is None.
+"""
+def load_bundle(path, mmap_mode='r'):
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    columns = {}
+    for name in [k for k, _ in KEY_COLUMNS] + meta['statistics']:
+        columns[name] = numpy.load(os.path.join(path, name + '.npy'),
+            mmap_mode=mmap_mode)
+    written = columns['trial'] >= 0
+    if not written.all():
+        columns = {k: v[written] for k, v in columns.items()}
+    return meta, columns
+
+"""
+Returns the summary of the bundle at path: a list with one entry for each
+combination of method, number of players and number of rounds in the
+bundle, each a dict of those, the number of trials and, for each
+statistic, a dict of its mean, sample standard deviation and the bounds of
+the normal-approximation confidence interval for the mean.
+"""
+def summarize(path, confidence=DEFAULT_CONFIDENCE):
+    meta, columns = load_bundle(path)
+    # one integer key per row, as unique is much faster in one dimension
+    keys = ((columns['method'].astype(numpy.int64) << 40) |
+        (columns['num_players'].astype(numpy.int64) << 20) |
+        columns['num_rounds'])
+    groups, inverse = numpy.unique(keys, return_inverse=True)
+    counts = numpy.bincount(inverse, minlength=len(groups))
+    z = scipy.special.ndtri(0.5 + confidence / 2)
+    summary = [{'method': meta['methods'][g >> 40],
+        'num_players': (g >> 20) & 0xfffff, 'num_rounds': g & 0xfffff,
+        'trials': int(c)} for g, c in zip(groups.tolist(), counts)]
+    for s in meta['statistics']:
+        values = numpy.asarray(columns[s])
+        means = numpy.bincount(inverse, values, len(groups)) / counts
+        squares = numpy.bincount(inverse, (values - means[inverse])**2,
+            len(groups))
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            stds = numpy.sqrt(squares / (counts - 1))
+        half_widths = z * stds / numpy.sqrt(counts)
+        for entry, m, sd, h in zip(summary, means, stds, half_widths):
+            entry[s] = {'mean': m, 'std': sd, 'low': m - h, 'high': m + h}
+    return summary
+
+"""
+Running count, mean and variance of a statistic for each of several
+methods, updated a batch of values at a time (combining the moments of
+the batch with those so far, which is exact up to rounding), for deciding
+when to stop running trials.
+"""
+class RunningSummary(object):
+    def __init__(self, num_methods):
+        self._counts = numpy.zeros(num_methods, dtype=numpy.int64)
+        self._means = numpy.zeros(num_methods)
+        self._squares = numpy.zeros(num_methods)
+    
+    def add(self, method, values):
+        values = numpy.asarray(values, dtype=float)
+        n = len(values)
+        if n == 0:
+            return
+        mean = values.mean()
+        squares = ((values - mean)**2).sum()
+        total = self._counts[method] + n
+        delta = mean - self._means[method]
+        self._squares[method] += (squares +
+            delta**2 * self._counts[method] * n / total)
+        self._means[method] += delta * n / total
+        self._counts[method] = total
+    
+    @property
+    def counts(self):
+        return self._counts.copy()
+    
+    @property
+    def means(self):
+        return self._means.copy()
+    
+    @property
+    def stds(self):
+        """Sample standard deviations, nan for fewer than two values."""
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.sqrt(self._squares / (self._counts - 1))
+    
+    def half_widths(self, confidence=DEFAULT_CONFIDENCE):
+        """Half widths of the confidence intervals for the means."""
+        z = scipy.special.ndtri(0.5 + confidence / 2)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return z * self.stds / numpy.sqrt(self._counts)
+    
+    def difference_z_scores(self):
+        """Array of the z-scores of the differences between the means of
+        each pair of methods, row minus column."""
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            variances = self.stds**2 / self._counts
+            return (numpy.subtract.outer(self._means, self._means) /
+                numpy.sqrt(numpy.add.outer(variances, variances)))
+
+def print_summary(summary, confidence=DEFAULT_CONFIDENCE):
+    statistics = [s for s in tourney_metrics.STATISTICS
+        if summary and s in summary[0]]
+    for s in statistics:
+        print(s)
+        print('   Method    Players Rounds  Trials   Mean   Std.Dev.  '
+            '{0:4.1f}% confidence interval'.format(100 * confidence))
+        print('------------ ------- ------ -------- -------- -------- '
+            '---------------------')
+        for entry in summary:
+            print('{0:12.12s} {1:7d} {2:6d} {3:8d} {4:0.6f} {5:0.6f} '
+                '[{6:0.6f}, {7:0.6f}]'.format(entry['method'],
+                entry['num_players'], entry['num_rounds'], entry['trials'],
+                entry[s]['mean'], entry[s]['std'], entry[s]['low'],
+                entry[s]['high']))
+        print('')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Summarize a bundle of trial results')
+    parser.add_argument('path', help='the directory of the bundle')
+    parser.add_argument('--confidence', type=float, dest='confidence',
+        default=DEFAULT_CONFIDENCE,
+        help='the confidence level of the intervals')
+    args = parser.parse_args()
+    print_summary(summarize(args.path, args.confidence), args.confidence)
@@ -1,17 +1,23 @@
 from __future__ import division
 import random
-import tourney
-import itertools
-import scipy.stats
+import numpy
+import tourney_metrics
+from tourney_metrics import rank_array, spearman_array, \
+    spearman_rank_coefficients
 
+"""A simulated player of a given (or, by default, random) ability.
+
+Players are compact, without a __dict__, as simulations create a great
+many of them, and are hashed by identity like other objects.
+"""
 class PlayerWithAbility(object):
-    def __init__(self, name, ability):
-        self._name = name
-        self._ability = ability
+    __slots__ = ('_name', '_ability')
     
-    def __init__(self, name):
+    def __init__(self, name, ability=None):
         self._name = name
-        self._ability = random.gauss(0, 1)
+        if ability is None:
+            ability = random.gauss(0, 1)
+        self._ability = ability
     
     @property
     def name(self):
@@ -56,7 +62,7 @@ def print_score_table(t, print_scoreboard=False):
                 k.name, k.ability, v))
         else:
             result_string = ""
-            for r in t.scoreboard:
+            for r in t.scoreboard_view:
                 matches = filter(lambda x:k in x, r)
                 if len(matches) == 0:
                     result_string += "."
@@ -70,127 +76,278 @@ def print_score_table(t, print_scoreboard=False):
                 k.name, k.ability, v, result_string))
 
 def rank_list(original_list):
-    sorted_list = sorted(original_list)
-    ranks = {}
-    distinct_elements = sorted(list(set(original_list)))
-    seen_elements = 0
-    for e in distinct_elements:
-        r = seen_elements + 1 + sorted_list.count(e) / 2.0
-        ranks[e] = r
-        seen_elements += sorted_list.count(e)
-    return map(lambda x:ranks[x], original_list)
+    return rank_array(original_list).tolist()
 
 def compute_spearman_rank_coefficient(t):
-    rkg = t.ranking()
-    pairs = sorted([(x, rkg[x]) for x in t.players], key=lambda x:-x[1])
-    abilities = [x[0].ability for x in pairs]
-    rank_keys = [x[1] for x in pairs]
-    ability_ranks = rank_list(abilities)
-    ranks = rank_list(rank_keys)
+    games, abilities, rankings = tourney_metrics.tournament_arrays(t)
     # compute the spearman (defeats tank) coefficient
-    return spearman(ability_ranks, ranks)
+    return float(spearman_rank_coefficients(abilities, rankings))
 
 def spearman(first_rank_list, second_rank_list):
     assert(len(first_rank_list) == len(second_rank_list))
-    mean = (len(first_rank_list) + 1) / 2.0
-    normed_first_rank_list = [x - mean for x in first_rank_list]
-    normed_second_rank_list = [x - mean for x in second_rank_list]
-    numerator = sum([x[0] * x[1] for x in zip(normed_first_rank_list,
-        normed_second_rank_list)])
-    denominator = (sum([x**2 for x in normed_first_rank_list]) *
-        sum([x**2 for x in normed_second_rank_list]))**0.5
-    return numerator/denominator
-
-def get_players(num_players=20):
+    return float(spearman_array(numpy.asarray(first_rank_list, dtype=float),
+        numpy.asarray(second_rank_list, dtype=float)))
+
+"""Returns independent random generators for num_streams parallel streams
+(e.g. one per trial) derived from the given seed.
+
+These are numpy Generators spawned from a SeedSequence where numpy provides
+them (1.17 and later).  Older versions, as used with Python 2, get
+RandomStates seeded with the pair (seed, stream number), or seeded from
+the operating system if seed is None.  Only the methods the two have in
+common, such as normal and shuffle, should be used.
+"""
+def spawn_rngs(seed, num_streams):
+    if hasattr(numpy.random, 'SeedSequence'):
+        return [numpy.random.default_rng(s) for s in
+            numpy.random.SeedSequence(seed).spawn(num_streams)]
+    return [stream_rng(seed, i) for i in range(num_streams)]
+
+"""Returns the random generator of the given stream number, the same as
+spawn_rngs(seed, num_streams)[stream], without creating the others, so
+that a worker process can create the generator of its own trial."""
+def stream_rng(seed, stream):
+    if hasattr(numpy.random, 'SeedSequence'):
+        if seed is None:
+            return numpy.random.default_rng()
+        return numpy.random.default_rng(
+            numpy.random.SeedSequence(seed, spawn_key=(stream,)))
+    elif seed is None:
+        return numpy.random.RandomState()
+    else:
+        return numpy.random.RandomState([seed, stream])
+
+"""Returns the names of the players of get_players."""
+def player_names(num_players):
     if num_players <= 20:
     # Brought to you by the Atlantic hurricane list, 2013...
-        player_names = ['Andrea', 'Barry', 'Chantal', 'Dorian', 'Erin',
+        return ['Andrea', 'Barry', 'Chantal', 'Dorian', 'Erin',
         'Fernand', 'Gabrielle', 'Humberto', 'Ingrid', 'Jerry', 'Karen',
         'Lorenzo', 'Melissa', 'Nestor', 'Olga', 'Pablo', 'Rebekah',
         'Sebastien', 'Tanya', 'Van'][:num_players]
     else:
-        player_names = [str(x) for x in range(1, num_players + 1)]
-    players = []
-    for name in player_names:
-        players.append(PlayerWithAbility(name))
-    return players
+        return [str(x) for x in range(1, num_players + 1)]
+
+"""Returns a list of players with the given abilities (a sequence or 1-D
+array), named by player_names unless names are given."""
+def players_from_abilities(abilities, names=None):
+    abilities = numpy.asarray(abilities, dtype=float).tolist()
+    if names is None:
+        names = player_names(len(abilities))
+    return [PlayerWithAbility(name, ability)
+        for name, ability in zip(names, abilities)]
+
+"""Returns a list of players of random ability.  The abilities are drawn
+from the random module, or all at once from rng if one is given."""
+def get_players(num_players=20, rng=None):
+    if rng is None:
+        return [PlayerWithAbility(name)
+            for name in player_names(num_players)]
+    return players_from_abilities(rng.normal(size=num_players))
 
 def compute_closeness_value(t):
-    total = 0.0
-    for pair in itertools.combinations(t.players, 2):
-        total += (t.win_matrix_entry(pair[0], pair[1]) +
-            t.win_matrix_entry(pair[1], pair[0])) * (
-            pair[0].ability - pair[1].ability)**2
-    return total
+    games, abilities, rankings = tourney_metrics.tournament_arrays(t)
+    return float(tourney_metrics.closeness_values(games, abilities))
 
 def compute_match_information(t):
-    # See Glickman and Jensen 2005
-    total = 0.0
-    for pair in itertools.combinations(t.players, 2):
-        p = scipy.stats.norm.cdf(pair[0].ability - pair[1].ability)
-        total += (t.win_matrix_entry(pair[0], pair[1]) +
-            t.win_matrix_entry(pair[1], pair[0])) * (
-            p * (1-p))
-    return total
+    games, abilities, rankings = tourney_metrics.tournament_arrays(t)
+    return float(tourney_metrics.match_informations(games, abilities))
 
 def compute_win_share(t):
-    # 1/n if the top ability player finishes tied for 1st with n players
-    # 0 otherwise
-    #players = t.players
-    #best_player = players[0]
-    #for p in players[1:]:
-    #    if p.ability > best_player.ability:
-    #        best_player = p
-    players = t.players
-    best_player = [p for p in players if p.ability ==
-        max([q.ability for q in players])][0]
-    # this may not be well-defined if we have floating-point problems, but
-    # it will have to do for now
-    ranking = t.ranking()
-    highest_ranked_players = [p for p in players if ranking[p] ==
-        max([ranking[q] for q in players])]
-    if best_player in highest_ranked_players:
-        return 1.0/len(highest_ranked_players)
-    else:
-        return 0.0
+    games, abilities, rankings = tourney_metrics.tournament_arrays(t)
+    return float(tourney_metrics.win_shares(abilities, rankings))
+
+def _ability(player):
+    return player.ability
+
+"""Returns the results of the pairs of players.  The noise of each game is
+drawn from the random module, or all at once from rng if one is given.
 
-def simulate_round(pairs):
-    results = [list(pair) for pair in pairs]
-    for r in results:
-        noise = random.gauss(0, 1)
+Pairings are sets, iterated in an order that depends upon the ids of the
+players, so with rng the games are first put in order of ability for the
+results to be reproducible from the state of rng.
+"""
+def simulate_round(pairs, rng=None):
+    if rng is None:
+        results = [list(pair) for pair in pairs]
+        noises = (random.gauss(0, 1) for r in results)
+    else:
+        results = sorted((sorted(pair, key=_ability, reverse=True)
+            for pair in pairs), key=lambda r: r[0].ability)
+        noises = rng.normal(size=len(results)).tolist()
+    for r, noise in zip(results, noises):
         if r[0].ability + noise < r[1].ability:
             r.reverse()
     return results
 
-def test_harness(t, rounds, verbose=True, print_scoreboard=True):
+'''Observer of the simulation of a tournament by play_rounds and
+test_harness.
+
+Subclasses override the methods for the events they are interested in;
+each does nothing by default.
+'''
+class Reporter(object):
+    def round_started(self, t, round_number):
+        pass
+    
+    def pairing_made(self, t, pairing):
+        pass
+    
+    def results_pushed(self, t, results):
+        pass
+    
+    def statistics_computed(self, t, statistics):
+        pass
+    
+    def profiled(self, t, profiler):
+        pass
+
+'''Reporter printing the progress of a tournament to the console, as
+test_harness does when verbose.'''
+class ConsoleReporter(Reporter):
+    STATISTIC_FORMATS = (
+        ('rank_coefficient', "Rank coefficient (raw scores): {0:7.4f}"),
+        ('closeness_value', "Closeness value: {0:9.4f}"),
+        ('match_information', "Match information: {0:9.4f}"),
+        ('win_share', "Win share: {0:7.4f}"))
+    
+    def __init__(self, print_scoreboard=True):
+        self._print_scoreboard = print_scoreboard
+    
+    def round_started(self, t, round_number):
+        print("Starting round {0}".format(round_number))
+    
+    def pairing_made(self, t, pairing):
+        print_pairing(pairing, t)
+    
+    def results_pushed(self, t, results):
+        print_results(results)
+        print_score_table(t, self._print_scoreboard)
+    
+    def statistics_computed(self, t, statistics):
+        for name, statistic_format in self.STATISTIC_FORMATS:
+            if name in statistics:
+                print(statistic_format.format(statistics[name]))
+    
+    def profiled(self, t, profiler):
+        print(profiler.report())
+
+"""Plays the given number of rounds of a tournament, reporting each round
+to the reporter if one is given.  The results are simulated with rng, as
+in simulate_round."""
+def play_rounds(t, rounds, reporter=None, rng=None):
+    if reporter is None:
+        for r in range(rounds):
+            t.push_results(simulate_round(t.next_pairing(), rng))
+        return
     for r in range(1, rounds + 1):
-        if verbose:
-            print("Starting round {0}".format(r))
+        reporter.round_started(t, r)
         pairs = t.next_pairing()
-        if verbose:
-            print_pairing(pairs, t)
-        results = simulate_round(pairs)
-        if verbose:
-            print_results(results)
+        reporter.pairing_made(t, pairs)
+        results = simulate_round(pairs, rng)
         t.push_results(results)
-        if verbose:
-            print_score_table(t, print_scoreboard)
-    return_dict = {}
-    rank_coeff = compute_spearman_rank_coefficient(t)
-    return_dict['rank_coefficient'] = rank_coeff
-    if verbose:
-        print("Rank coefficient (raw scores): {0:7.4f}".format(
-            rank_coeff))
-    cv = compute_closeness_value(t)
-    return_dict['closeness_value'] = cv
-    if verbose:
-        print("Closeness value: {0:9.4f}".format(cv))
-    match_information = compute_match_information(t)
-    return_dict['match_information'] = match_information
-    if verbose:
-        print("Match information: {0:9.4f}".format(match_information))
-    win_share = compute_win_share(t)
-    return_dict['win_share'] = win_share
-    if verbose:
-        print("Win share: {0:7.4f}".format(win_share))
+        reporter.results_pushed(t, results)
+
+"""Plays the given number of rounds of a tournament and returns a dict of
+its statistics (see tourney_metrics).  Only the statistics named are
+computed; by default, all of them.  Progress is reported to the reporter,
+if one is given, or else printed to the console if verbose.  The results
+are simulated with rng, as in simulate_round.
+
+If a tourney_profile.TournamentProfiler is given, it is attached to the
+tournament and, once the statistics are computed, passed to the reporter.
+Passing the same profiler for several tournaments totals their times.
+"""
+def test_harness(t, rounds, verbose=True, print_scoreboard=True,
+    statistics=tourney_metrics.STATISTICS, reporter=None, rng=None,
+    profiler=None):
+    if reporter is None and verbose:
+        reporter = ConsoleReporter(print_scoreboard)
+    if profiler is not None:
+        profiler.attach(t)
+    play_rounds(t, rounds, reporter, rng)
+    return_dict = tourney_metrics.tournament_statistics(t, statistics)
+    if reporter is not None:
+        reporter.statistics_computed(t, return_dict)
+        if profiler is not None:
+            reporter.profiled(t, profiler)
     return return_dict
+
+"""Returns a card system as an integer array of shape (rounds, num_games, 2)
+listing the pairs of cards of each round.  Rounds with fewer than
+num_games games (by default, the most games in any round) are padded with
+pairs (num_players, num_players) of a dummy card.
+"""
+def card_system_array(card_system, num_players, num_games=None):
+    if num_games is None:
+        num_games = max([len(matches) for matches in card_system] + [0])
+    cards = numpy.empty((len(card_system), num_games, 2), dtype=int)
+    cards.fill(num_players)
+    for r, matches in enumerate(card_system):
+        if len(matches) > 0:
+            cards[r, :len(matches)] = list(matches)
+    return cards
+
+"""Plays a batch of power-matched tournaments at once.
+
+card_system and final_card_rankings are as for PowerMatchedTournament;
+card_system may instead be an array with one card_system_array per
+tournament, so that each tournament uses its own card system.  abilities
+is an array with one row of player abilities per tournament; every
+tournament is played for len(card_system) rounds, each game going to the
+first player of the pair if their ability plus standard normal noise is at
+least that of the second player, as in simulate_round.  The noise is drawn
+from rng, or numpy.random if none is given, unless an array of shape
+(len(abilities), rounds, games) is given, in which case the kth game listed
+in round r of the card system uses noise[:, r, k].
+
+Returns a dict mapping each of the given statistics of test_harness (by
+default, all of them) to an array of its value in each tournament,
+together with an array of the number of games played between each pair of
+players in each tournament.
+"""
+def simulate_power_matched_tournaments(card_system, final_card_rankings,
+    abilities, noise=None, statistics=tourney_metrics.STATISTICS, rng=None):
+    abilities = numpy.asarray(abilities, dtype=float)
+    num_trials, num_players = abilities.shape
+    if isinstance(card_system, numpy.ndarray):
+        cards = card_system
+    else:
+        cards = card_system_array(card_system, num_players)[numpy.newaxis]
+    trials = numpy.arange(num_trials)[:, numpy.newaxis]
+    # The dummy card and player num_players fill out rounds with fewer
+    # games; their games have no effect.
+    padded_abilities = numpy.zeros((num_trials, num_players + 1))
+    padded_abilities[:, :num_players] = abilities
+    # player_with_card[t, c] is the player holding card c in tournament t
+    player_with_card = numpy.tile(numpy.arange(num_players + 1),
+        (num_trials, 1))
+    wins = numpy.zeros((num_trials, num_players + 1, num_players + 1),
+        dtype=int)
+    for r in range(cards.shape[1]):
+        round_cards = numpy.broadcast_to(cards[:, r],
+            (num_trials,) + cards.shape[2:])
+        first = player_with_card[trials, round_cards[..., 0]]
+        second = player_with_card[trials, round_cards[..., 1]]
+        if noise is not None:
+            round_noise = noise[:, r, :first.shape[1]]
+        elif rng is not None:
+            round_noise = rng.normal(size=first.shape)
+        else:
+            round_noise = numpy.random.normal(size=first.shape)
+        first_wins = (padded_abilities[trials, first] + round_noise >=
+            padded_abilities[trials, second])
+        winners = numpy.where(first_wins, first, second)
+        losers = numpy.where(first_wins, second, first)
+        wins[trials, winners, losers] += 1
+        player_with_card[trials, round_cards.min(axis=-1)] = winners
+        player_with_card[trials, round_cards.max(axis=-1)] = losers
+    wins = wins[:, :num_players, :num_players]
+    player_with_card = player_with_card[:, :num_players]
+    games = wins + wins.transpose(0, 2, 1)
+    card_rankings = numpy.array([final_card_rankings[c]
+        for c in range(num_players)], dtype=float)
+    ranking = numpy.empty((num_trials, num_players))
+    ranking[trials, player_with_card] = card_rankings
+    return (tourney_metrics.statistics(games, abilities, ranking, statistics),
+        games)
@@ -1,8 +1,15 @@
 from __future__ import division
 import tourney
 import tourney_sim
+import tourney_metrics
+import tourney_results
 import math
 import multiprocessing
+import numpy
+import scipy.special
+import random
+import sys
+import time
 
 def test1():
     players = tourney_sim.get_players()
@@ -11,20 +18,21 @@ def test1():
     tourney_sim.test_harness(t, rounds)
 
 def weight_function(t, x, y):
-    if t.win_matrix_entry(x, y) > 0 or t.win_matrix_entry(y, x) > 0:
+    if t.games_played_entry(x, y) > 0:
         raise tourney.ImpossibleMatch
     else:
-        return -abs(t.score_table[x] - t.score_table[y])
+        return -abs(t.score_table_view[x] - t.score_table_view[y])
 
 def weight_function2(t, x, y):
-    num_previous_matches = t.win_matrix[(x, y)] + t.win_matrix[(y, x)]
+    num_previous_matches = (t.win_matrix_view[(x, y)] +
+        t.win_matrix_view[(y, x)])
     repeat_penalty = 0 if num_previous_matches == 0 else (
         2 * num_previous_matches + 1)
-    score_penalty = 2 * abs(t.score_table[x] - t.score_table[y])
+    score_penalty = 2 * abs(t.score_table_view[x] - t.score_table_view[y])
     return -(repeat_penalty + score_penalty)
 
 def weight_function3(t, x, y):
-    num_previous_matches = t.win_matrix_entry(x, y) + t.win_matrix_entry(y, x)
+    num_previous_matches = t.games_played_entry(x, y)
     repeat_divisor = 1 << num_previous_matches
     rx = t.modified_bradley_terry_ratings(x)
     ry = t.modified_bradley_terry_ratings(y)
@@ -33,7 +41,7 @@ def weight_function3(t, x, y):
 
 def weight_function4(t, x, y):
     alpha = 1
-    num_previous_matches = t.win_matrix_entry(x, y) + t.win_matrix_entry(y, x)
+    num_previous_matches = t.games_played_entry(x, y)
     rx = t.modified_bradley_terry_ratings(x)
     ry = t.modified_bradley_terry_ratings(y)
     return (math.log(rx) + math.log(ry) - 2 * math.log(rx + ry) -
@@ -41,56 +49,132 @@ def weight_function4(t, x, y):
 
 def weight_function5(t, x, y):
     alpha = 0.5
-    num_previous_matches = t.win_matrix_entry(x, y) + t.win_matrix_entry(y, x)
+    num_previous_matches = t.games_played_entry(x, y)
     rx = t.modified_bradley_terry_ratings(x)
     ry = t.modified_bradley_terry_ratings(y)
     return (1 + alpha * num_previous_matches) * (math.log(rx) + math.log(ry) -
         2 * math.log(rx + ry))
 
+# Batch versions of the weight functions above, for use as the
+# batch_weight_function of a MatchingPairedTournament.  Each returns the
+# weights of all pairs at once together with the feasibility mask.
+
+def _games_played(t):
+    return t.games_array
+
+def _all_pairs_feasible(t):
+    feasible = numpy.ones((len(t.players_view),) * 2, dtype=bool)
+    numpy.fill_diagonal(feasible, False)
+    return feasible
+
+def _bradley_terry_information(t):
+    # log(rx) + log(ry) - 2 * log(rx + ry) for every pair of players
+    ratings = t.modified_bradley_terry_rating_array()
+    log_ratings = numpy.log(ratings)
+    return (numpy.add.outer(log_ratings, log_ratings) -
+        2 * numpy.log(numpy.add.outer(ratings, ratings)))
+
+def batch_weight_function(t):
+    scores = t.score_array
+    feasible = _games_played(t) == 0
+    numpy.fill_diagonal(feasible, False)
+    return -numpy.abs(numpy.subtract.outer(scores, scores)), feasible
+
+def batch_weight_function2(t):
+    num_previous_matches = _games_played(t)
+    repeat_penalty = numpy.where(num_previous_matches == 0, 0,
+        2 * num_previous_matches + 1)
+    scores = t.score_array
+    score_penalty = 2 * numpy.abs(numpy.subtract.outer(scores, scores))
+    return -(repeat_penalty + score_penalty), _all_pairs_feasible(t)
+
+def batch_weight_function3(t):
+    repeat_divisor = numpy.ldexp(1.0, _games_played(t))
+    return (numpy.exp(_bradley_terry_information(t)) / repeat_divisor,
+        _all_pairs_feasible(t))
+
+def batch_weight_function4(t):
+    alpha = 1
+    return (_bradley_terry_information(t) - alpha * _games_played(t),
+        _all_pairs_feasible(t))
+
+def batch_weight_function5(t):
+    alpha = 0.5
+    return ((1 + alpha * _games_played(t)) * _bradley_terry_information(t),
+        _all_pairs_feasible(t))
+
 def test2():
     
     players = tourney_sim.get_players(20)
-    t = tourney.MatchingPairedTournament(players, weight_function5)
+    t = tourney.MatchingPairedTournament(players, weight_function5,
+        batch_weight_function5)
     rounds = 4 * (len(players) - 1)
     
     tourney_sim.test_harness(t, rounds, True, True)
 
-def test3():
+"""Compares round robin and the two matching tournaments of test4 by their
+rank coefficients, one trial at a time.  If a bundle path is given, every
+statistic of each trial is also written there as a tourney_results bundle.
+"""
+def test3(bundle=None):
     NUM_TRIALS = 500
     PLAYERS = 20
     ROUNDS = 19
     ranks = {x : [] for x in ('round_robin', 'matching1', 'matching2')}
+    if bundle is None:
+        writer = None
+        statistics = ('rank_coefficient',)
+    else:
+        writer = tourney_results.ResultWriter(bundle, 3 * NUM_TRIALS,
+            ('Round robin', 'Matching 1', 'Matching 2'))
+        statistics = tourney_metrics.STATISTICS
     print("Round robin data")
     print("----------------")
     for trial in range(NUM_TRIALS):
         players = tourney_sim.get_players(PLAYERS)
         t = tourney.RoundRobinPairedTournament(players)
-        rc = tourney_sim.test_harness(t, ROUNDS, verbose=False)[
-            'rank_coefficient']
+        values = tourney_sim.test_harness(t, ROUNDS, verbose=False,
+            statistics=statistics)
+        rc = values['rank_coefficient']
         print("{0:8.6f}".format(rc))
         ranks['round_robin'].append(rc)
+        if writer is not None:
+            writer.write(0 * NUM_TRIALS + trial, trial, 0, PLAYERS, ROUNDS,
+                None, values)
     
     print("")
     print("Matching 1 data ")
     print("----------------")
     for trial in range(NUM_TRIALS):
         players = tourney_sim.get_players(PLAYERS)
-        t = tourney.MatchingPairedTournament(players, weight_function4)
-        rc = tourney_sim.test_harness(t, ROUNDS, verbose=False)[
-            'rank_coefficient']
+        t = tourney.MatchingPairedTournament(players, weight_function4,
+            batch_weight_function4)
+        values = tourney_sim.test_harness(t, ROUNDS, verbose=False,
+            statistics=statistics)
+        rc = values['rank_coefficient']
         print("{0:8.6f}".format(rc))
         ranks['matching1'].append(rc)
+        if writer is not None:
+            writer.write(1 * NUM_TRIALS + trial, trial, 1, PLAYERS, ROUNDS,
+                None, values)
     
     print("")
     print("Matching 2 data ")
     print("----------------")
     for trial in range(NUM_TRIALS):
         players = tourney_sim.get_players(PLAYERS)
-        t = tourney.MatchingPairedTournament(players, weight_function5)
-        rc = tourney_sim.test_harness(t, ROUNDS, verbose=False)[
-            'rank_coefficient']
+        t = tourney.MatchingPairedTournament(players, weight_function5,
+            batch_weight_function5)
+        values = tourney_sim.test_harness(t, ROUNDS, verbose=False,
+            statistics=statistics)
+        rc = values['rank_coefficient']
         print("{0:8.6f}".format(rc))
         ranks['matching2'].append(rc)
+        if writer is not None:
+            writer.write(2 * NUM_TRIALS + trial, trial, 2, PLAYERS, ROUNDS,
+                None, values)
+    if writer is not None:
+        writer.close()
     print("")
     print("Summary stats   ")
     print("----------------")
@@ -117,36 +201,223 @@ def test3():
 
 #to make this pickleable
 def run_test(tup):
-    #tup[0] is a tournament, tup[1] is the number of rounds
-    return tourney_sim.test_harness(tup[0], tup[1], verbose=False)[
-        tup[2]]
+    #tup[0] is a tournament, tup[1] is the number of rounds, tup[3] is the
+    #random generator for the results
+    return tourney_sim.test_harness(tup[0], tup[1], verbose=False,
+        statistics=(tup[2],), rng=tup[3])[tup[2]]
 
-"""Generate an iterator for tournaments"""
-def tourney_generator(num_trials, num_players, num_rounds, test_statistic):
+"""Generate an iterator for tournaments.  Each trial has its own random
+generator, spawned from seed, for the abilities of its players and the
+results of its games, so the results do not depend upon which worker
+process runs which trial."""
+def tourney_generator(num_trials, num_players, num_rounds, test_statistic,
+    seed=None):
+    rngs = iter(tourney_sim.spawn_rngs(seed, 3 * num_trials))
     for i in range(num_trials):
+        rng = next(rngs)
         yield (tourney.RoundRobinPairedTournament(
-            tourney_sim.get_players(num_players)), num_rounds,
-            test_statistic)
+            tourney_sim.get_players(num_players, rng)), num_rounds,
+            test_statistic, rng)
     for i in range(num_trials):
+        rng = next(rngs)
         yield (tourney.MatchingPairedTournament(
-            tourney_sim.get_players(num_players),
-            weight_function4), num_rounds, test_statistic)
+            tourney_sim.get_players(num_players, rng),
+            weight_function4, batch_weight_function4), num_rounds,
+            test_statistic, rng)
     for i in range(num_trials):
+        rng = next(rngs)
         yield (tourney.MatchingPairedTournament(
-            tourney_sim.get_players(num_players),
-            weight_function5), num_rounds, test_statistic)
+            tourney_sim.get_players(num_players, rng),
+            weight_function5, batch_weight_function5), num_rounds,
+            test_statistic, rng)
     
 
+"""The tournaments compared by test4, as (CSV column, constructor) pairs"""
+TEST4_METHODS = (
+    ('Round Robin', tourney.RoundRobinPairedTournament),
+    ('wf4', lambda players: tourney.MatchingPairedTournament(players,
+        weight_function4, batch_weight_function4)),
+    ('wf5', lambda players: tourney.MatchingPairedTournament(players,
+        weight_function5, batch_weight_function5)))
+
+"""Runs the trial given by a spec of (trial, method, num_trials, num_players,
+num_rounds, statistics, seed), where method is an index into TEST4_METHODS,
+and returns (trial, method, values), where values is the dict of the
+statistics returned by test_harness.  The tournament is built in the worker
+so that only the spec is sent to it.  The trial uses the same random stream
+as in tourney_generator with the same seed."""
+def run_trial(spec):
+    (trial, method, num_trials, num_players, num_rounds, statistics,
+        seed) = spec
+    rng = tourney_sim.stream_rng(seed, method * num_trials + trial)
+    t = TEST4_METHODS[method][1](tourney_sim.get_players(num_players, rng))
+    return (trial, method, tourney_sim.test_harness(t, num_rounds,
+        verbose=False, statistics=statistics, rng=rng))
+
+"""Generates the specs of run_trial, trial by trial, for the trials from
+start up to stop (by default, all num_trials of them)"""
+def trial_specs(num_trials, num_players, num_rounds, statistics, seed,
+    start=0, stop=None):
+    if stop is None:
+        stop = num_trials
+    for trial in range(start, stop):
+        for method in range(len(TEST4_METHODS)):
+            yield (trial, method, num_trials, num_players, num_rounds,
+                statistics, seed)
+
+"""Returns the default chunksize for farming num_tasks tasks out to workers
+processes: large enough to amortize interprocess overhead, small enough for
+steady progress and few results held out of order."""
+def _default_chunksize(num_tasks, workers):
+    return max(1, min(64, num_tasks // (16 * workers)))
+
+"""
+A multiprocess test comparing TEST4_METHODS, writing one CSV row per trial
+to output (by default, standard output) and progress to progress_output
+every progress_interval trials (never if 0).
+
+Results are written as they arrive, in order of trial, so memory use does
+not grow with num_trials: the workers are sent small trial specs, and only
+the results of trials finished ahead of an unfinished one are held.  The
+results are reproducible given a seed; one is chosen at random, and
+reported with the progress, if none is given.
+
+If a bundle path is given, every statistic of each trial is also written
+there as a tourney_results bundle, row method * num_trials + trial.
+"""
 def test4(num_trials=10, num_players=20, num_rounds=19,
-    test_statistic='rank_coefficient'):
-    # A multithreaded test
-    pool = multiprocessing.Pool(None)
-    results = pool.map(run_test, tourney_generator(num_trials, num_players,
-        num_rounds, test_statistic))
-    print('Round Robin,wf4,wf5')
-    for i in range(num_trials):
-        print(','.join(['{0:0.6f}'.format(results[i + num_trials * x]) for
-            x in range(3)]))
+    test_statistic='rank_coefficient', seed=None, output=None,
+    workers=None, chunksize=None, progress_interval=1000,
+    progress_output=None, bundle=None):
+    if output is None:
+        output = sys.stdout
+    if progress_output is None:
+        progress_output = sys.stderr
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    num_methods = len(TEST4_METHODS)
+    if chunksize is None:
+        chunksize = _default_chunksize(num_trials * num_methods, workers)
+    if progress_interval:
+        progress_output.write('Seed {0}, {1} workers, chunksize {2}\n'.format(
+            seed, workers, chunksize))
+    if bundle is None:
+        writer = None
+        statistics = (test_statistic,)
+    else:
+        writer = tourney_results.ResultWriter(bundle,
+            num_trials * num_methods, [name for name, _ in TEST4_METHODS])
+        statistics = tourney_metrics.STATISTICS
+    output.write(','.join(name for name, _ in TEST4_METHODS) + '\n')
+    pool = multiprocessing.Pool(workers)
+    pending = {}
+    next_trial = 0
+    start_time = time.time()
+    try:
+        for trial, method, values in pool.imap_unordered(run_trial,
+            trial_specs(num_trials, num_players, num_rounds, statistics,
+            seed), chunksize):
+            if writer is not None:
+                writer.write(method * num_trials + trial, trial, method,
+                    num_players, num_rounds, seed, values)
+            pending.setdefault(trial, [None] * num_methods)[method] = (
+                values[test_statistic])
+            first_row = next_trial
+            while (next_trial in pending and
+                None not in pending[next_trial]):
+                output.write(','.join('{0:0.6f}'.format(x)
+                    for x in pending.pop(next_trial)) + '\n')
+                next_trial += 1
+                if progress_interval and (next_trial % progress_interval ==
+                    0 or next_trial == num_trials):
+                    elapsed = time.time() - start_time
+                    progress_output.write(
+                        '{0}/{1} trials, {2:.1f}s elapsed, {3:.1f}s left\n'
+                        .format(next_trial, num_trials, elapsed,
+                        elapsed * (num_trials - next_trial) / next_trial))
+            # Flush each run of rows written, so that the CSV streams in
+            # trial order with or without progress.
+            if next_trial > first_row:
+                output.flush()
+    finally:
+        # Every result has been received unless interrupted.
+        pool.terminate()
+        pool.join()
+        if writer is not None:
+            writer.close()
+
+"""
+Runs the trials of test4 in batches of batch_trials until the means of
+test_statistic are known well enough, then prints a summary including the
+number of trials saved relative to max_trials.
+
+The trials stop once the confidence interval (at the given confidence) for
+the mean of every method is at most width wide, or, if stop_on_difference,
+once the difference between the means of some pair of methods is
+significant at the same confidence; but never before min_trials.  As the
+criteria are checked after every batch, the chance of wrongly finding a
+difference significant is larger than one minus confidence; choose it
+accordingly.
+The trials run are the first ones of test4 with the same seed and
+num_trials=max_trials, so a seed makes the results reproducible.
+"""
+def sequential_test4(max_trials=100000, num_players=20, num_rounds=19,
+    test_statistic='rank_coefficient', width=0.005,
+    confidence=tourney_results.DEFAULT_CONFIDENCE, stop_on_difference=False,
+    batch_trials=1000, min_trials=100, seed=None, workers=None):
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    num_methods = len(TEST4_METHODS)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    chunksize = _default_chunksize(batch_trials * num_methods, workers)
+    z_threshold = scipy.special.ndtri(0.5 + confidence / 2)
+    summary = tourney_results.RunningSummary(num_methods)
+    trials = 0
+    reason = 'reached the maximum number of trials'
+    print('Seed {0}'.format(seed))
+    print(' Trials  ' + ' '.join('{0:>20.20s}'.format(name)
+        for name, _ in TEST4_METHODS))
+    pool = multiprocessing.Pool(workers)
+    try:
+        while trials < max_trials:
+            stop = min(trials + batch_trials, max_trials)
+            values = [[] for m in range(num_methods)]
+            for trial, method, result in pool.imap_unordered(run_trial,
+                trial_specs(max_trials, num_players, num_rounds,
+                (test_statistic,), seed, trials, stop), chunksize):
+                values[method].append(result[test_statistic])
+            for method in range(num_methods):
+                summary.add(method, values[method])
+            trials = stop
+            means = summary.means
+            half_widths = summary.half_widths(confidence)
+            print('{0:7d}  '.format(trials) + ' '.join(
+                '{0:0.6f} +- {1:0.6f}'.format(m, h)
+                for m, h in zip(means, half_widths)))
+            if trials < min_trials:
+                continue
+            if (2 * half_widths <= width).all():
+                reason = 'every confidence interval is narrow enough'
+                break
+            if stop_on_difference:
+                z_scores = summary.difference_z_scores()
+                x, y = numpy.unravel_index(numpy.nanargmax(z_scores),
+                    z_scores.shape)
+                if z_scores[x, y] >= z_threshold:
+                    reason = ('the mean of {0} exceeds that of {1} '
+                        '(z-score {2:0.4f})').format(
+                        TEST4_METHODS[x][0], TEST4_METHODS[y][0],
+                        z_scores[x, y])
+                    break
+    finally:
+        pool.terminate()
+        pool.join()
+    print('Stopped after {0} trials, saving {1}: {2}'.format(trials,
+        max_trials - trials, reason))
+    return summary
 
 def test5():
     players = tourney_sim.get_players(8)
@@ -170,4 +441,6 @@ if __name__ == "__main__":
     #test4(num_trials=1000, num_players=40, num_rounds=39)
     #test4(num_trials=100000, num_players=10, num_rounds=9, test_statistic=
     #    'rank_coefficient')
+    #with open('tourney_test_results13.csv', 'w') as f:
+    #    test4(num_trials=100000, num_players=10, num_rounds=9, output=f)
     test5()